@@ -0,0 +1,153 @@
+from cohorts import compress, hold_production, production_changes, run_day, run_days
+
+
+class Analytics:
+    """ ROI statistics of a Player, updated in O(1) per day without looking back at history
+
+    value is MEAD in wallet plus unclaimed MEAD. The hodl baseline is the value the player would have by only
+    holding the breweries it had when the analytics started (followed as compressed brewery cohorts).
+    Player calls update() after every change of the day, a repeated update of the same day replaces the previous.
+    """
+
+    def __init__(self, day, value, invested, brewery_states):
+        """
+        :param day: day the analytics start
+        :param value: MEAD in wallet plus unclaimed MEAD on that day
+        :param invested: MEAD invested in breweries
+        :param brewery_states: (days after claim, days after fermentation period, mead) of every brewery
+        """
+        self.start_day = self.day = day
+        self.start_value = self.value = value
+        self.invested = invested
+        self.hodl_value = value
+        self.daily_yield = 0.  # value gained on the last day (MEAD)
+        self.break_even_day = day if invested and value >= invested else None  # first day value >= invested
+        self.tier_days = [None, None]  # first day with a T2 and with a T3 brewery
+        self.peak_vs_hodl = 0.  # highest value - hodl_value so far
+        self.max_drawdown_vs_hodl = 0.  # largest fall of value - hodl_value from its peak
+        self._cohorts = compress(brewery_states)
+        self._previous_value = value
+        self._before_day = None  # aggregates before the first update of the day, restored by a repeated update
+
+    @property
+    def vs_hodl(self):
+        """ MEAD ahead (or behind, if negative) of the hodl baseline """
+        return self.value - self.hodl_value
+
+    @property
+    def roi(self):
+        """ Value gained since the start per MEAD invested, None without investment """
+        return (self.value - self.start_value)/self.invested if self.invested else None
+
+    @property
+    def apr(self):
+        """ Annualized roi (simple, in %), None without investment or before the first day """
+        days = self.day - self.start_day
+        return self.roi*365/days*100 if self.invested and days else None
+
+    @property
+    def days_to_tier(self):
+        """ Days from the start until the first T2 and the first T3 brewery (None if not reached) """
+        return [None if day is None else day - self.start_day for day in self.tier_days]
+
+    def update(self, day, value, brews_per_tier):
+        """ Records the state of the player at the end of `day` (so far) """
+        if day != self.day:
+            if day == self.day + 1:
+                self._cohorts, mead, _ = run_day(self._cohorts)
+            else:
+                self._cohorts, mead, _ = run_days(self._cohorts, day - self.day)
+            self.hodl_value += mead
+            self._previous_value = self.value
+            self.day = day
+            self._before_day = None
+        if self._before_day is None:
+            self._before_day = (self.break_even_day, list(self.tier_days), self.peak_vs_hodl,
+                                self.max_drawdown_vs_hodl)
+        else:
+            self.break_even_day, self.tier_days, self.peak_vs_hodl, self.max_drawdown_vs_hodl = self._before_day
+            self.tier_days = list(self.tier_days)
+
+        self.value = value
+        self.daily_yield = value - self._previous_value
+        if self.break_even_day is None and self.invested and value >= self.invested:
+            self.break_even_day = day
+        for tier, count in enumerate(brews_per_tier[1:]):
+            if self.tier_days[tier] is None and count:
+                self.tier_days[tier] = day
+        vs_hodl = self.vs_hodl
+        self.peak_vs_hodl = max(self.peak_vs_hodl, vs_hodl)
+        self.max_drawdown_vs_hodl = max(self.max_drawdown_vs_hodl, self.peak_vs_hodl - vs_hodl)
+
+    def update_span(self, day, mead_in_wallet, unclaimed_mead, daily_mead, brews_per_tier):
+        """ Records the days after self.day up to `day` at once, like update() for each of them, when unclaimed MEAD
+            grew by daily_mead every day and nothing else changed (e.g. during a span without brewery events).
+            Takes time per change of the hodl baseline's production instead of per day.
+
+        :param mead_in_wallet: MEAD in wallet during the span
+        :param unclaimed_mead: unclaimed MEAD at the end of `day` (kept apart from mead_in_wallet so the values of the
+                               days before add up exactly like the player's)
+        """
+        days = day - self.day - 1  # days before the last one, which update() records
+
+        def value(k):  # on the k-th day of the span
+            return mead_in_wallet + (unclaimed_mead - (days + 1 - k)*daily_mead)
+
+        if days > 0:
+            first_day = self.day + 1
+            if self.break_even_day is None and self.invested and value(days) >= self.invested:
+                # first k with value(k) >= invested
+                k = max(1, days + 1 - int((mead_in_wallet + unclaimed_mead - self.invested)//daily_mead)) \
+                    if daily_mead > 0 else 1
+                while k > 1 and value(k - 1) >= self.invested:
+                    k -= 1
+                while value(k) < self.invested:
+                    k += 1
+                self.break_even_day = first_day - 1 + k
+            for tier, count in enumerate(brews_per_tier[1:]):
+                if self.tier_days[tier] is None and count:
+                    self.tier_days[tier] = first_day
+
+            # value - hodl_value is linear between the days before the hodl production changes, so its peak and
+            # drawdowns only need to be checked on those days
+            for k in sorted({1, days, *(change - 1 for change in production_changes(self._cohorts, days))}):
+                hodl_value = self.hodl_value + sum(n*hold_production(*cohort, k)[0] for cohort, n in self._cohorts)
+                vs_hodl = value(k) - hodl_value
+                self.peak_vs_hodl = max(self.peak_vs_hodl, vs_hodl)
+                self.max_drawdown_vs_hodl = max(self.max_drawdown_vs_hodl, self.peak_vs_hodl - vs_hodl)
+
+            self._cohorts, mead, _ = run_days(self._cohorts, days)
+            self.hodl_value += mead
+            self.value = value(days)
+            self.day = day - 1
+            self._before_day = None
+        self.update(day, mead_in_wallet + unclaimed_mead, brews_per_tier)
+
+    def copy(self):
+        other = Analytics.__new__(Analytics)
+        other.__dict__.update(self.__dict__)
+        other.tier_days = list(self.tier_days)
+        return other
+
+    def state(self):
+        """ :return: JSON-serializable state for from_state (e.g. in Player snapshots) """
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_state(cls, state):
+        """ Inverse of state() """
+        analytics = cls.__new__(cls)
+        analytics.__dict__.update(state)
+        analytics._cohorts = tuple((tuple(key), n) for key, n in state["_cohorts"])
+        analytics.tier_days = list(state["tier_days"])
+        if state["_before_day"] is not None:
+            break_even_day, tier_days, peak, max_drawdown = state["_before_day"]
+            analytics._before_day = (break_even_day, list(tier_days), peak, max_drawdown)
+        return analytics
+
+    def summary(self):
+        """ :return: dict of the statistics (e.g. for sweep results) """
+        days_to_t2, days_to_t3 = self.days_to_tier
+        return {"break_even_day": self.break_even_day, "roi": self.roi, "apr": self.apr,
+                "vs_hodl": self.vs_hodl, "max_drawdown_vs_hodl": self.max_drawdown_vs_hodl,
+                "days_to_t2": days_to_t2, "days_to_t3": days_to_t3}
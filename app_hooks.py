@@ -1 +1,27 @@
+""" Bokeh server lifecycle hooks: drop the simulation context of closed sessions, evict idle ones and stop the job
+    workers with the server
+"""
+from tornado.ioloop import PeriodicCallback
 
+from jobs import JOBS
+from sessions import SESSIONS
+
+EVICT_INTERVAL = 60_000  # ms between checks for idle sessions
+
+_evict_callback = None
+
+
+def on_server_loaded(server_context):
+    global _evict_callback
+    _evict_callback = PeriodicCallback(SESSIONS.evict_idle, EVICT_INTERVAL)
+    _evict_callback.start()
+
+
+def on_server_unloaded(server_context):
+    if _evict_callback is not None:
+        _evict_callback.stop()
+    JOBS.shutdown()
+
+
+def on_session_destroyed(session_context):
+    SESSIONS.remove(session_context.id)
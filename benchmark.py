@@ -0,0 +1,241 @@
+""" Benchmarks of the simulation core
+
+Examples:
+    python benchmark.py --quick --save baseline.json
+    python benchmark.py --quick --compare baseline.json
+    python benchmark.py --imports
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from classes import Player
+from engine import VectorPlayer
+from strategies import STRATEGIES, run_strategy
+
+ENGINES = {"player": Player, "vector": VectorPlayer}
+BREWERIES = (1, 10, 100, 1000, 10000)
+HORIZONS = (30, 365, 3650)
+QUICK_BREWERIES = (1, 100, 1000)
+QUICK_HORIZONS = (30, 365)
+CHUNK_DAYS = 30  # days run between checks of the time limit
+REPEATS = 5  # speed is the best of this many measurements (fewer if they would take longer than the time limit)
+MIN_SECONDS = 0.1  # a measurement repeats short runs until it took at least this long
+NOISE_FLOOR = 0.005  # seconds per run below which compare() ignores speed changes
+
+# seconds allowed for importing a module in a fresh interpreter, the simulation core must not need the UI
+IMPORT_BUDGETS = {"classes": 0.1, "strategies": 0.1, "optimizer": 0.1,
+                  "engine": 0.5, "sweep": 0.5, "montecarlo": 0.5, "cache": 0.5, "plotdata": 0.5,
+                  "instrumentation": 0.1, "jobs": 0.5}
+UI_MODULES = ("bokeh", "tornado")
+IMPORT_REPEATS = 5
+_IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+ui_modules = [name for name in {ui_modules!r} if name in sys.modules]
+import classes
+classes.Player()  # needs the names file
+print(seconds, *ui_modules)
+"""
+
+
+def _run(engine, strategy, num_breweries, days, time_limit=None):
+    """ Runs one case in chunks of days until the horizon or the time limit is reached
+
+    :return: player, days run, seconds
+    """
+    player = ENGINES[engine](num_breweries, name="benchmark")
+    start = time.perf_counter()
+    while player.day < days:
+        run_strategy(player, strategy, min(CHUNK_DAYS, days - player.day))
+        if time_limit is not None and time.perf_counter() - start > time_limit:
+            break
+    return player, player.day, time.perf_counter() - start
+
+
+def _measure(engine, strategy, num_breweries, days_run):
+    """ Runs the case from scratch until at least MIN_SECONDS passed
+
+    :return: seconds per run
+    """
+    runs = 0
+    seconds = 0.
+    while seconds < MIN_SECONDS:
+        gc.collect()
+        _, _, run_seconds = _run(engine, strategy, num_breweries, days_run)
+        seconds += run_seconds
+        runs += 1
+    return seconds/runs
+
+
+def run_case(engine, strategy, num_breweries, days, time_limit=1., days_run=None, repeats=REPEATS):
+    """ Measures speed (best of repeats), then memory of one case (the memory run repeats the days of the speed run)
+
+    :param days_run: run exactly this many days instead of stopping at time_limit (e.g. to repeat a baseline case)
+
+    :return: dict with the case and seconds (per run), days_per_sec, peak_memory (bytes, tracemalloc),
+             retained_blocks_per_day (memory blocks still allocated after the run, while the player is alive, per
+             simulated day, i.e. how fast the state of a player grows; not the allocations made per day)
+    """
+    gc.collect()
+    if days_run is None:
+        player, days_run, seconds = _run(engine, strategy, num_breweries, days, time_limit)
+    else:
+        player, days_run, seconds = _run(engine, strategy, num_breweries, days_run)
+    final_breweries = player.num_breweries
+    del player
+    measurements = [seconds] if seconds >= MIN_SECONDS else []  # the first run counts if it was long enough
+    spent = seconds
+    while len(measurements) < repeats and (not measurements or spent <= time_limit):
+        start = time.perf_counter()
+        measurements.append(_measure(engine, strategy, num_breweries, days_run))
+        spent += time.perf_counter() - start
+    seconds = min(measurements)
+
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    player, _, _ = _run(engine, strategy, num_breweries, days_run)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sys.getallocatedblocks() - blocks
+    del player
+
+    return {"engine": engine, "strategy": strategy, "breweries": num_breweries, "days": days,
+            "days_run": days_run, "final_breweries": final_breweries, "seconds": seconds,
+            "days_per_sec": days_run/seconds if seconds else float("inf"),
+            "peak_memory": peak_memory, "retained_blocks_per_day": blocks/max(days_run, 1)}
+
+
+def run_benchmarks(engines=tuple(ENGINES), strategies=tuple(STRATEGIES), breweries=BREWERIES, horizons=HORIZONS,
+                   time_limit=1., baseline=None, verbose=True, repeats=REPEATS):
+    """ :param baseline: results of an earlier run; cases found there run for the same number of days
+        :return: list of run_case results for every combination
+    """
+    days_run = {_key(result): result["days_run"] for result in baseline or ()}
+    results = []
+    for case in itertools.product(engines, strategies, breweries, horizons):
+        result = run_case(*case, time_limit=time_limit, days_run=days_run.get(case), repeats=repeats)
+        results.append(result)
+        if verbose:
+            print(_format(result), flush=True)
+    return results
+
+
+def _key(result):
+    return result["engine"], result["strategy"], result["breweries"], result["days"]
+
+
+def _format(result):
+    return (f"{result['engine']:>6} {result['strategy']:>22} {result['breweries']:>6} breweries "
+            f"{result['days_run']:>4}/{result['days']:<4} days: {result['days_per_sec']:>10.1f} days/s, "
+            f"peak {result['peak_memory']/1e6:>8.2f} MB, "
+            f"{result['retained_blocks_per_day']:>8.1f} retained blocks/day")
+
+
+def compare(results, baseline, tolerance=0.2, noise_floor=NOISE_FLOOR):
+    """ :param noise_floor: seconds per run below which speed isn't compared (too short to time reliably)
+        :return: list of messages about cases that got slower or use more memory than baseline by more than
+                 tolerance (relative)
+    """
+    baseline = {_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = baseline.get(_key(result))
+        if old is None or old["days_run"] != result["days_run"]:
+            continue  # not in baseline or cut short at a different day
+        timed = min(result["seconds"], old["seconds"]) >= noise_floor
+        if timed and result["days_per_sec"] < old["days_per_sec"]*(1 - tolerance):
+            regressions.append(f"{_key(result)}: {old['days_per_sec']:.1f} -> {result['days_per_sec']:.1f} days/s")
+        if result["peak_memory"] > old["peak_memory"]*(1 + tolerance):
+            regressions.append(f"{_key(result)}: peak memory {old['peak_memory']} -> {result['peak_memory']} B")
+    return regressions
+
+
+def measure_import(module, repeats=IMPORT_REPEATS):
+    """ Imports module in fresh interpreters started outside the repository
+
+    :return: best import time of repeats in seconds, list of UI_MODULES the import pulled in
+    """
+    script = _IMPORT_SCRIPT.format(path=os.path.dirname(os.path.abspath(__file__)), module=module,
+                                   ui_modules=UI_MODULES)
+    times = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, "-c", script], cwd=cwd, capture_output=True, text=True,
+                                    check=True).stdout.split()
+            times.append(float(output[0]))
+    return min(times), output[1:]
+
+
+def check_imports(budgets=IMPORT_BUDGETS, verbose=True):
+    """ :return: list of messages about modules over their import time budget or importing UI_MODULES """
+    violations = []
+    for module, budget in budgets.items():
+        seconds, ui_modules = measure_import(module)
+        if verbose:
+            print(f"{module:>12}: {seconds*1000:>7.1f} ms (budget {budget*1000:.0f} ms)", flush=True)
+        if seconds > budget:
+            violations.append(f"{module}: import took {seconds*1000:.1f} ms, budget {budget*1000:.0f} ms")
+        if ui_modules:
+            violations.append(f"{module}: imports {', '.join(ui_modules)}")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Player/VectorPlayer per strategy, size and horizon.")
+    parser.add_argument("--engine", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--strategy", nargs="+", default=list(STRATEGIES))
+    parser.add_argument("--breweries", type=int, nargs="+", default=None)
+    parser.add_argument("--days", type=int, nargs="+", default=None)
+    parser.add_argument("--quick", action="store_true", help="smaller grid of breweries and horizons")
+    parser.add_argument("--time-limit", type=float, default=1., help="seconds per case before it is cut short")
+    parser.add_argument("--save", default=None, help="save results as JSON baseline")
+    parser.add_argument("--compare", default=None, help="compare with JSON baseline, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown/memory growth allowed")
+    parser.add_argument("--noise-floor", type=float, default=NOISE_FLOOR,
+                        help="seconds per run below which speed is not compared")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="speed measurements per case (best is kept)")
+    parser.add_argument("--imports", action="store_true",
+                        help="check cold import times against IMPORT_BUDGETS instead, exit 1 on violation")
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        violations = check_imports()
+        for violation in violations:
+            print(f"VIOLATION {violation}")
+        if violations:
+            sys.exit(1)
+        return
+
+    breweries = args.breweries or (QUICK_BREWERIES if args.quick else BREWERIES)
+    horizons = args.days or (QUICK_HORIZONS if args.quick else HORIZONS)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+    results = run_benchmarks(args.engine, args.strategy, breweries, horizons, args.time_limit, baseline,
+                             repeats=args.repeats)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version, "results": results}, f, indent=1)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.noise_floor)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
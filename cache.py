@@ -0,0 +1,179 @@
+""" Content-addressed cache of simulation runs
+
+A run is addressed by the state of the player before it (everything but name and history), the strategy and the
+brewery price. For every run length the cache keeps the history rows it added and the player state after it, in an
+in-memory LRU and, optionally, on disk (a memory-mapped .npy of rows plus a state snapshot per entry). A run looks
+up the longest cached run of the same address that is not longer than requested and only simulates the rest, e.g.
+400 days extend a cached 300-day run.
+
+Only strategies with a Strategy.key() are cached, runs with others are simulated every time. Cache hits don't emit
+events to the player's event log.
+
+Set TAVERN_CACHE_DIR to give the shared CACHE an on-disk store.
+"""
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from classes import Brewery
+from history import History
+from strategies import get_strategy, run_strategy
+
+_VERSION = b"TAVCACHE2"  # change when simulation rules or the snapshot format change
+
+
+def _state_bytes(player):
+    """ :return: Player snapshot of the current state without name and history """
+    return player.to_bytes(history=False, name="")
+
+
+def _rows(history, start):
+    """ :return: history rows from start on as a structured array """
+    views = history.slice(start)
+    rows = np.empty(len(history) - start, dtype=[(name, np.asarray(views[name]).dtype) for name in History.columns])
+    for name in History.columns:
+        rows[name] = views[name]
+    return rows
+
+
+def _apply(player, rows, state):
+    """ Sets player to the state after a run (see _state_bytes), appending the history rows the run added """
+    restored = type(player).from_bytes(state, event_log=player.event_log)
+    restored.name = player.name
+    restored._history = player.history.fork()
+    restored._history.extend(len(rows), **{name: rows[name].tolist() for name in History.columns})
+    player.restore(restored)
+
+
+class TrajectoryCache:
+    """ Thread-safe cache of runs (see module docstring), in memory up to max_memory bytes, least recently used
+        entries evicted first
+    """
+
+    def __init__(self, directory=None, max_memory=64*2**20):
+        """
+        :param directory: directory of the on-disk store (None = memory only), created if missing
+        :param max_memory: bytes of rows and states kept in memory
+        """
+        self.directory = directory
+        self.max_memory = max_memory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (key, days) -> (rows, state), least recently used first
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(player, strategy, brewery_price=Brewery.price_default):
+        """ :return: hex address of running player from its current state with strategy and brewery_price
+            :raises ValueError: if strategy has no key (see Strategy.key)
+        """
+        strategy_key = get_strategy(strategy).key()
+        if strategy_key is None:
+            raise ValueError(f"Strategy {strategy!r} has no key, its runs can't be cached.")
+        digest = hashlib.sha256(_VERSION)
+        digest.update(_state_bytes(player))
+        digest.update(f"|{strategy_key}|{brewery_price!r}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key, days):
+        return os.path.join(self.directory, f"{key}_{days}")
+
+    def _cached_days(self, key, days):
+        """ :return: most days <= `days` cached for key (memory or disk), 0 if none """
+        with self._lock:
+            cached = [d for k, d in self._entries if k == key and d <= days]
+        if self.directory is not None:
+            for path in glob.glob(os.path.join(self.directory, f"{key}_*.state")):
+                d = int(os.path.basename(path)[len(key) + 1:-len(".state")])
+                if d <= days:
+                    cached.append(d)
+        return max(cached, default=0)
+
+    def _get(self, key, days):
+        """ :return: (rows, state) of the entry, None if it isn't cached """
+        with self._lock:
+            entry = self._entries.get((key, days))
+            if entry is not None:
+                self._entries.move_to_end((key, days))
+                return entry
+        if self.directory is None:
+            return None
+        path = self._path(key, days)
+        try:
+            rows = np.load(path + ".npy", mmap_mode="r")
+            with open(path + ".state", "rb") as f:
+                state = f.read()
+        except FileNotFoundError:
+            return None
+        self._put_in_memory(key, days, rows, state)
+        return rows, state
+
+    def _put_in_memory(self, key, days, rows, state):
+        with self._lock:
+            old = self._entries.pop((key, days), None)
+            if old is not None:
+                self._nbytes -= old[0].nbytes + len(old[1])
+            self._entries[(key, days)] = (rows, state)
+            self._nbytes += rows.nbytes + len(state)
+            while self._nbytes > self.max_memory and len(self._entries) > 1:
+                _, (old_rows, old_state) = self._entries.popitem(last=False)
+                self._nbytes -= old_rows.nbytes + len(old_state)
+
+    def _put(self, key, days, rows, state):
+        self._put_in_memory(key, days, rows, state)
+        if self.directory is not None:
+            path = self._path(key, days)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, rows)
+            os.replace(tmp, path + ".npy")  # atomic, so readers see complete files only
+            with open(tmp, "wb") as f:
+                f.write(state)
+            os.replace(tmp, path + ".state")  # written last: marks the entry as complete
+
+    def run(self, player, strategy, days, brewery_price=Brewery.price_default):
+        """ Runs player for `days` days like strategies.run_strategy, reusing the longest cached prefix of the run
+
+        :param player: Player (or VectorPlayer), modified in place
+        """
+        if days <= 0:
+            return
+        if get_strategy(strategy).key() is None:
+            run_strategy(player, strategy, days, brewery_price)
+            return
+        key = self.key(player, strategy, brewery_price)
+        start_row = len(player.history)
+        cached_days = self._cached_days(key, days)
+        entry = self._get(key, cached_days) if cached_days else None
+        if entry is not None:
+            _apply(player, *entry)
+            if cached_days == days:
+                self.hits += 1
+                return
+        self.misses += 1
+        run_strategy(player, strategy, days - (cached_days if entry is not None else 0), brewery_price)
+        self._put(key, days, _rows(player.history, start_row), _state_bytes(player))
+
+    def clear(self, disk=False):
+        """ Empties the in-memory LRU, and the on-disk store if disk """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+        if disk and self.directory is not None:
+            for path in glob.glob(os.path.join(self.directory, "*_*.npy")) + \
+                    glob.glob(os.path.join(self.directory, "*_*.state")):
+                os.remove(path)
+
+
+# shared by all sessions of the Bokeh server app
+CACHE = TrajectoryCache(os.environ.get("TAVERN_CACHE_DIR"))
@@ -1,16 +1,36 @@
+import copy
 import json
+import os
 import random
+import struct
+from array import array
+from functools import lru_cache
+from itertools import accumulate, repeat
 
-with open("./data/names.json", "r") as f:
-    PLAYER_NAMES = json.load(f)
+import events
+from analytics import Analytics
+from cohorts import BR_PER_DAY, DAYS_TO_TIER_UP, FERM_PERIOD, TIER_MEAD_PROD
+from history import History
+from instrumentation import PROFILER
+
+NAMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "names.json")
+
+
+@lru_cache(maxsize=None)
+def player_names():
+    """ :return: tuple of names for players created without one (read from NAMES_PATH on first use) """
+    with open(NAMES_PATH, "r") as f:
+        return tuple(json.load(f))
 
 
 class Brewery:
+    __slots__ = ("_price", "_mead", "_days_after_claim", "_days_after_fp", "_tier", "_age", "_daily_mead_prod",
+                 "_claim")
     price_default = 100  # MEAD
-    __ferm_period = 14  # days after buy/claim during which no xp or br is earned
-    __days_to_tier_up = [14, 42, 99999]  # cummulative days after FP needed to tier up (T2, T3, T4)
-    __tier_mead_prod = [2, 3, 4]  # mead/day (resp. to tier)
-    __br_per_day = 20  # BR/day after fermentation period
+    __ferm_period = FERM_PERIOD  # days after buy/claim during which no xp or br is earned
+    __days_to_tier_up = DAYS_TO_TIER_UP  # cummulative days after FP needed to tier up (T2, T3, T4)
+    __tier_mead_prod = TIER_MEAD_PROD  # mead/day (resp. to tier)
+    __br_per_day = BR_PER_DAY  # BR/day after fermentation period
 
     def __init__(self, price=price_default):
         self.price = price
@@ -26,6 +46,22 @@ class Brewery:
     def tier(self):
         return self._tier
 
+    def state(self):
+        """ :return: price, mead, days after claim, days after fermentation period, tier, age """
+        return self._price, self._mead, self._days_after_claim, self._days_after_fp, self._tier, self._age
+
+    @classmethod
+    def from_state(cls, price, mead, days_after_claim, days_after_fp, tier, age):
+        """ Inverse of Brewery.state() """
+        brewery = cls(price)
+        brewery._mead = mead
+        brewery._days_after_claim = days_after_claim
+        brewery._days_after_fp = days_after_fp
+        brewery._tier = tier
+        brewery._age = age
+        brewery._daily_mead_prod = cls.__tier_mead_prod[tier]
+        return brewery
+
     def run_day(self):
         """ Runs the brewery for one day
 
@@ -50,6 +86,30 @@ class Brewery:
 
         return self._daily_mead_prod, br_reward
 
+    def days_to_next_event(self):
+        """ Number of upcoming days with the same mead and br reward as today (no end of fermentation period
+            and no tier upgrade in between)
+        """
+        if self._days_after_claim < self.__ferm_period:
+            return self.__ferm_period - self._days_after_claim
+        return self.__days_to_tier_up[self._tier] - self._days_after_fp
+
+    def run_days(self, n):
+        """ Runs the brewery for n days, where n must not be larger than days_to_next_event()
+
+        :return: mead reward per day, brewer rank reward per day
+        """
+        if self._days_after_claim >= self.__ferm_period:
+            self._days_after_fp += n
+            br_reward = self.__br_per_day
+        else:
+            br_reward = 0
+        self._days_after_claim += n
+        self._age += n
+        self._mead += n*self._daily_mead_prod
+
+        return self._daily_mead_prod, br_reward
+
     def claim(self, claim_tax):
         mead = self._mead
         mead_after_tax = mead*(1 - claim_tax)
@@ -64,24 +124,34 @@ class Brewery:
 
     @price.setter
     def price(self, value):
-        if value >= 0 and isinstance(value, int):
-            self._price = value
-        else:
-            self._price = self.price_default
-            print(f"Default price of {self.price_default} MEAD was set.")
+        if not self.valid_price(value) and events.default_log.enabled:
+            events.default_log.emit(events.DefaultPriceSet(None, self.price_default))  # Player checks prices first
+        self._price = self.checked_price(value)
+
+    @staticmethod
+    def valid_price(value):
+        return isinstance(value, int) and value >= 0
+
+    @classmethod
+    def checked_price(cls, value):
+        """ Returns value if it is a valid brewery price, otherwise price_default """
+        return value if cls.valid_price(value) else cls.price_default
 
 
 class Player:
+    __snapshot_magic = b"TAVSNAP1"  # start of Player.to_bytes() output
     __rank_names = ["novice", "brewer", "brewlord", "brewmaster"]
     __max_rank = len(__rank_names) - 1
     __br_requirements = [0, 50, 500, 2500]  # resp. to rank
     __claim_taxes = [0.18, 0.16, 0.14, 0.12]  # resp. to rank
 
-    def __init__(self, num_breweries=0, price_per_brewery=100, br=0, unclaimed_mead=0., mead_in_wallet=0., name=None):
-        self.name = str(name) if name is not None else PLAYER_NAMES.pop(random.randint(0, len(PLAYER_NAMES)-1))
+    def __init__(self, num_breweries=0, price_per_brewery=100, br=0, unclaimed_mead=0., mead_in_wallet=0., name=None,
+                 event_log=None):
+        self.name = str(name) if name is not None else random.choice(player_names())
         self.num_breweries = 0
         self.brews_per_tier = [0, 0, 0]
-        self.breweries = {}
+        self._init_breweries()
+        self.event_log = event_log if event_log is not None else events.default_log  # see events.EventLog
         self._day = 0
         self._rank = 0
         self._rank_name = self.__rank_names[self.rank]
@@ -92,19 +162,16 @@ class Player:
         self.mead_in_wallet = mead_in_wallet
         self.br = br  # also updates _rank and _rank_name
 
-        self._history = {"day": [self.day, ],
-                         "breweries_per_tier": {"t1": [self.brews_per_tier[0], ],
-                                                "t2": [self.brews_per_tier[1], ],
-                                                "t3": [self.brews_per_tier[2], ]},
-                         "unclaimed_mead": [self.unclaimed_mead, ],
-                         "mead_in_wallet": [self.mead_in_wallet, ]}
+        self._history = History()
+        self._history.append(self.day, *self.brews_per_tier, self.unclaimed_mead, self.mead_in_wallet)
 
         # initial buy of breweries
-        for _ in range(num_breweries):
-            self.buy_brewery(price_per_brewery)
+        self.buy_breweries(num_breweries, price_per_brewery)
 
         # invested MEAD during the initial buy
-        self.invested_mead = sum(brw.price for brw in self.breweries.values())
+        self.invested_mead = self._total_brewery_price()
+        self.analytics = Analytics(self.day, self.mead_in_wallet + self.unclaimed_mead, self.invested_mead,
+                                   self._brewery_states())
 
     def __str__(self):
         return (f"Player stats:".center(61, "_") + "\n"
@@ -160,7 +227,11 @@ class Player:
             else:
                 break  # TODO: Test
 
-    def run_day(self):
+    def _run_breweries(self):
+        """ Runs all breweries for one day
+
+        :return: mead produced, br earned, number of breweries per tier
+        """
         daily_mead = 0
         daily_br = 0
         num_breweries = [0, 0, 0]
@@ -169,53 +240,206 @@ class Player:
             daily_mead += mead
             daily_br += br
             num_breweries[brewery.tier] += 1  # populate new brewery tier distribution
+        return daily_mead, daily_br, num_breweries
+
+    def _init_breweries(self):
+        """ Sets up an empty self.breweries, a mapping of brewery id -> brewery """
+        self.breweries = {}
+
+    def _add_breweries(self, n, price):
+        """ Adds n new breweries to self.breweries under the ids following the current ones """
+        for i in range(self.num_breweries, self.num_breweries + n):
+            self.breweries[f"b{i:02d}"] = Brewery(price)
+
+    def _claim_brewery(self, brewery):
+        """ :return: untaxed mead claimed from brewery (value stored in self.breweries) """
+        mead, _ = brewery.claim(self.claim_tax)
+        return mead
+
+    def _claim_all_breweries(self):
+        """ :return: untaxed mead claimed from all breweries """
+        return sum(self._claim_brewery(brewery) for brewery in self.breweries.values())
+
+    def _total_brewery_price(self):
+        return sum(brw.price for brw in self.breweries.values())
+
+    def _fork_breweries(self):
+        """ Replaces breweries (shared with the player this one was copied from) by copies """
+        self.breweries = {b_id: copy.copy(brw) for b_id, brw in self.breweries.items()}
+
+    def _dump_breweries(self):
+        """ :return: Brewery.state() of all breweries as int64 columns in native byte order """
+        states = [brw.state() for brw in self.breweries.values()]
+        return b"".join(array("q", column).tobytes() for column in zip(*states))
+
+    def _load_breweries(self, data, n):
+        """ Inverse of _dump_breweries for n breweries """
+        columns = array("q")
+        columns.frombytes(data)
+        self.breweries = {f"b{i:02d}": Brewery.from_state(*columns[i::n]) for i in range(n)}
+
+    def _brewery_states(self):
+        """ :return: list of (days after claim, days after fermentation period, mead) of every brewery """
+        return [(brw._days_after_claim, brw._days_after_fp, brw._mead) for brw in self.breweries.values()]
+
+    def _days_to_next_event(self):
+        """ :return: number of upcoming days without any brewery event, None if there are no breweries """
+        return min((brewery.days_to_next_event() for brewery in self.breweries.values()), default=None)
+
+    def _run_breweries_for_days(self, n):
+        """ Runs all breweries for n uneventful days (see _days_to_next_event)
+
+        :return: mead produced per day, br earned per day, number of breweries per tier
+        """
+        daily_mead = 0
+        daily_br = 0
+        for brewery in self.breweries.values():
+            mead, br = brewery.run_days(n)
+            daily_mead += mead
+            daily_br += br
+        return daily_mead, daily_br, list(self.brews_per_tier)
+
+    def run_day(self):
+        profiling = PROFILER.enabled  # see instrumentation
+        if profiling:
+            start = PROFILER.clock()
+            PROFILER.count("days")
+            PROFILER.count("breweries_processed", self.num_breweries)
+        daily_mead, daily_br, num_breweries = self._run_breweries()
+        if profiling:
+            start = PROFILER.add_time("breweries", start)
         self.unclaimed_mead += daily_mead
         self.br += daily_br
+        if profiling:
+            start = PROFILER.add_time("rank", start)
         self.brews_per_tier = num_breweries
         self._day += 1
 
-        self.history["day"].append(self.day)
-        self.history["breweries_per_tier"]["t1"].append(self.brews_per_tier[0])
-        self.history["breweries_per_tier"]["t2"].append(self.brews_per_tier[1])
-        self.history["breweries_per_tier"]["t3"].append(self.brews_per_tier[2])
-        self.history["unclaimed_mead"].append(self.unclaimed_mead)
-        self.history["mead_in_wallet"].append(self.mead_in_wallet)
+        self.history.append(self.day, *self.brews_per_tier, self.unclaimed_mead, self.mead_in_wallet)
+        if profiling:
+            start = PROFILER.add_time("history", start)
+        self.analytics.update(self.day, self.mead_in_wallet + self.unclaimed_mead, self.brews_per_tier)
+        if profiling:
+            PROFILER.add_time("analytics", start)
 
         return self.unclaimed_mead  # TODO: maybe change to daily mead to make more sense?
 
-    def run_breweries_for_n_days(self, n=1):
-        for _ in range(n):  # for each day
-            self.run_day()
+    def run_breweries_for_n_days(self, n=1, fast_forward=False):
+        """ Runs breweries for n days without claiming
+
+        :param n: number of days to run
+        :param fast_forward: jump over spans of days between brewery events (end of fermentation period, tier up)
+                             instead of running them one by one. Gives the same results and history.
+        :return: None
+        """
+        if not fast_forward:
+            for _ in range(n):  # for each day
+                self.run_day()
+            return
+
+        last_day = self.day + n
+        while self.day < last_day:
+            days_to_event = self._days_to_next_event()
+            span = last_day - self.day if days_to_event is None else min(days_to_event, last_day - self.day)
+            if span > 0:
+                self._run_span(span)
+            else:
+                self.run_day()  # something changes today
+
+    def _run_span(self, n):
+        """ Runs n uneventful days at once and fills history for all of them in bulk
+            (rank only changes claim tax, so it is updated once at the end of the span)
+        """
+        profiling = PROFILER.enabled
+        if profiling:
+            start = PROFILER.clock()
+            PROFILER.count("days", n)
+            PROFILER.count("breweries_processed", n*self.num_breweries)
+        daily_mead, daily_br, num_breweries = self._run_breweries_for_days(n)
+        if profiling:
+            start = PROFILER.add_time("breweries", start)
+        unclaimed_mead = list(accumulate(repeat(daily_mead, n), initial=self.unclaimed_mead))[1:]
+        self.unclaimed_mead = unclaimed_mead[-1]
+        self.br += n*daily_br
+        if profiling:
+            start = PROFILER.add_time("rank", start)
+        self.brews_per_tier = num_breweries
+
+        self.history.extend(n,
+                            day=range(self.day + 1, self.day + n + 1),
+                            t1=repeat(self.brews_per_tier[0], n),
+                            t2=repeat(self.brews_per_tier[1], n),
+                            t3=repeat(self.brews_per_tier[2], n),
+                            unclaimed_mead=unclaimed_mead,
+                            mead_in_wallet=repeat(self.mead_in_wallet, n))
+        if profiling:
+            start = PROFILER.add_time("history", start)
+        self.analytics.update_span(self.day + n, self.mead_in_wallet, self.unclaimed_mead, daily_mead,
+                                   self.brews_per_tier)
+        if profiling:
+            PROFILER.add_time("analytics", start)
+        self._day += n
 
     def claim_from_brewery(self, brewery_id: str):
         """ DONT FORGET TO TAX AFTERWARD!
 
-        :param brewery_id (str): id of the brewery Player wants to claim mead from
+        :param brewery_id (str): id of the brewery Player wants to claim mead from (VectorPlayer also takes the
+                                 brewery's integer row)
         :return: None
         """
+        profiling = PROFILER.enabled
+        if profiling:
+            start = PROFILER.clock()
         try:
-            mead, mead_after_tax = self.breweries[brewery_id].claim(self.claim_tax)
+            mead = self._claim_brewery(self.breweries[brewery_id])
+            if profiling:
+                PROFILER.add_time("claim", start)
+                PROFILER.count("claims")
             self.unclaimed_mead -= mead
             self._claimed_mead += mead
-            print(f"Sucessfully claimed {mead:.2f} MEAD (before tax) from brewery {brewery_id}.")
-            self.history["unclaimed_mead"][-1] = self.unclaimed_mead
+            if self.event_log.enabled:
+                self.event_log.emit(events.Claimed(self.day, brewery_id, mead))
+            self.history.set_last("unclaimed_mead", self.unclaimed_mead)
+            self.analytics.update(self.day, self.mead_in_wallet + self.unclaimed_mead, self.brews_per_tier)
         except KeyError:
-            print(f"Player doesn't own a brewery with id: {brewery_id}.")
+            if self.event_log.enabled:
+                self.event_log.emit(events.UnknownBrewery(self.day, brewery_id))
 
     def tax_claimed_mead_to_wallet(self):
         if self._claimed_mead > 0:
             self.mead_in_wallet += self._claimed_mead - self._claimed_mead*self.claim_tax
-            print(f"Taxed {self._claimed_mead} MEAD with tax of {self.claim_tax*100:.0f} %. New Wallet balance: {self.mead_in_wallet} MEAD.")
+            if self.event_log.enabled:
+                self.event_log.emit(events.Taxed(self.day, self._claimed_mead, self.claim_tax, self.mead_in_wallet))
             self._claimed_mead = 0
-            self.history["mead_in_wallet"][-1] = self.mead_in_wallet
+            self.history.set_last("mead_in_wallet", self.mead_in_wallet)
+            self.analytics.update(self.day, self.mead_in_wallet + self.unclaimed_mead, self.brews_per_tier)
         else:
-            print("No claimed mead to tax.")
+            if self.event_log.enabled:
+                self.event_log.emit(events.NothingToTax(self.day))
+
+    def claim_all(self):
+        """ Claims mead from all breweries at once. DONT FORGET TO TAX AFTERWARD!
+
+        :return: untaxed mead claimed
+        """
+        profiling = PROFILER.enabled
+        if profiling:
+            start = PROFILER.clock()
+        mead = self._claim_all_breweries()
+        if profiling:
+            PROFILER.add_time("claim", start)
+            PROFILER.count("claims")
+        self.unclaimed_mead -= mead
+        self._claimed_mead += mead
+        if self.event_log.enabled:
+            self.event_log.emit(events.Claimed(self.day, None, mead))
+        self.history.set_last("unclaimed_mead", self.unclaimed_mead)
+        self.analytics.update(self.day, self.mead_in_wallet + self.unclaimed_mead, self.brews_per_tier)
+        return mead
 
     def claim_all_and_tax_to_wallet(self):
         # step 1: claim mead from all breweries
-        for b_id in self.breweries.keys():
-            self.claim_from_brewery(b_id)
-        print(f"Succesfully claimed MEAD from all breweries.")
+        self.claim_all()
         # step 2: tax all claimed mead and add to wallet
         self.tax_claimed_mead_to_wallet()
 
@@ -227,25 +451,115 @@ class Player:
         """
         if self.unclaimed_mead > price:
             # claim from all breweries but don't tax yet!
-            for brw_id in self.breweries.keys():
-                self.claim_from_brewery(brw_id)
+            self.claim_all()
 
             breweries_to_buy, mead_to_claim = divmod(self._claimed_mead, price)
-            for _ in range(int(breweries_to_buy)):
-                self.buy_brewery(price)
-                self._claimed_mead -= price
-            print(f"Bought {breweries_to_buy} Breweries, with new total of {self.num_breweries} Breweries.")
+            self.buy_breweries(int(breweries_to_buy), price)
+            self._claimed_mead -= int(breweries_to_buy)*price
+            if self.event_log.enabled:
+                self.event_log.emit(events.Compounded(self.day, int(breweries_to_buy), self.num_breweries))
             assert mead_to_claim == self._claimed_mead, "Something is wrong with rest of _claimed_mead calculations"
             # tax and add rest of mead to wallet
             self.tax_claimed_mead_to_wallet()
         else:
-            print(f"Not enough unclaimed mead to compound.")
+            if self.event_log.enabled:
+                self.event_log.emit(events.NotEnoughToCompound(self.day, self.unclaimed_mead))
 
     def buy_brewery(self, price):
-        b_id = f"b{self.num_breweries:02d}"
-        self.breweries[b_id] = Brewery(price)
-        self.num_breweries += 1  # update overall number of breweries
-        self.brews_per_tier[0] += 1  # update number of TIER 1 breweries
-        self.br += 10
-        self.history["breweries_per_tier"]["t1"][-1] = self.brews_per_tier[0]
-        print(f"Succesfully bought Brewery {b_id} for {price} MEAD.")
\ No newline at end of file
+        self.buy_breweries(1, price)
+
+    def buy_breweries(self, n, price):
+        """ Buys a cohort of n breweries at once (history and aggregates are updated once)
+
+        :param n: number of breweries
+        :param price: price of one Brewery in MEAD (price_default if it isn't valid)
+        """
+        if n <= 0:
+            return
+        if not Brewery.valid_price(price):
+            price = Brewery.price_default
+            if self.event_log.enabled:
+                self.event_log.emit(events.DefaultPriceSet(self.day, price))
+        profiling = PROFILER.enabled
+        if profiling:
+            start = PROFILER.clock()
+        first = self.num_breweries
+        self._add_breweries(n, price)
+        if profiling:
+            PROFILER.add_time("buy", start)
+            PROFILER.count("buys", n)
+        self.num_breweries += n  # update overall number of breweries
+        self.brews_per_tier[0] += n  # update number of TIER 1 breweries
+        self.br += 10*n
+        self.history.set_last("t1", self.brews_per_tier[0])
+        if self.event_log.enabled:
+            for i in range(first, first + n):
+                self.event_log.emit(events.BreweryBought(self.day, f"b{i:02d}", price))
+
+    def fork(self):
+        """ Independent copy of the player in its current state, e.g. to try out a what-if branch.
+            History is shared with this player copy-on-write.
+        """
+        other = copy.copy(self)
+        other.brews_per_tier = list(self.brews_per_tier)
+        other._history = self._history.fork()
+        other.analytics = self.analytics.copy()
+        other._fork_breweries()
+        return other
+
+    def snapshot(self):
+        """ :return: copy of the current state for restore() or to_bytes() (don't run it, fork() it) """
+        return self.fork()
+
+    def restore(self, snapshot):
+        """ Sets the player back to the state of snapshot (a Player of the same class) """
+        self.__dict__.update(snapshot.fork().__dict__)
+
+    def to_bytes(self, history=True, name=None):
+        """ Compact binary snapshot: magic, header length, JSON header, brewery columns and history columns
+
+        :param history: False saves the current state only (with an empty history)
+        :param name: name saved instead of the player's
+        :return: bytes for Player.from_bytes (arrays are in native byte order, the event log is not saved)
+        """
+        header = json.dumps({"name": self.name if name is None else name,
+                             "day": self.day,
+                             "br": self.br,
+                             "num_breweries": self.num_breweries,
+                             "brews_per_tier": self.brews_per_tier,
+                             "unclaimed_mead": self.unclaimed_mead,
+                             "claimed_mead": self._claimed_mead,
+                             "mead_in_wallet": self.mead_in_wallet,
+                             "invested_mead": self.invested_mead,
+                             "analytics": self.analytics.state(),
+                             "history_size": len(self.history) if history else 0}).encode()
+        return (self.__snapshot_magic + struct.pack("<I", len(header)) + header +
+                self._dump_breweries() + (self.history.to_bytes() if history else b""))
+
+    @classmethod
+    def from_bytes(cls, data, event_log=None):
+        """ Restores a player saved with to_bytes() """
+        data = memoryview(data)
+        magic_size = len(cls.__snapshot_magic)
+        if bytes(data[:magic_size]) != cls.__snapshot_magic:
+            raise ValueError("Data is not a Player snapshot.")
+        (header_size,) = struct.unpack_from("<I", data, magic_size)
+        offset = magic_size + 4
+        header = json.loads(bytes(data[offset:offset + header_size]))
+        offset += header_size
+
+        player = cls(name=header["name"], event_log=event_log)
+        num_breweries = header["num_breweries"]
+        breweries_size = len(Brewery().state())*num_breweries*array("q").itemsize
+        player._load_breweries(data[offset:offset + breweries_size], num_breweries)
+        player._history = History.from_bytes(data[offset + breweries_size:], header["history_size"])
+        player.num_breweries = num_breweries
+        player.brews_per_tier = header["brews_per_tier"]
+        player._day = header["day"]
+        player.br = header["br"]
+        player.unclaimed_mead = header["unclaimed_mead"]
+        player._claimed_mead = header["claimed_mead"]
+        player.mead_in_wallet = header["mead_in_wallet"]
+        player.invested_mead = header["invested_mead"]
+        player.analytics = Analytics.from_state(header["analytics"])
+        return player
@@ -0,0 +1,87 @@
+""" Brewery rules and compressed brewery cohorts
+
+A cohort is a group of breweries in the same state, ((days after claim, days after fermentation period), number of
+breweries). Once days after claim reach the fermentation period, or days after fermentation period pass the last
+tier up, the exact number no longer changes anything, so both are capped. Analytics follows its hodl baseline as
+cohorts and the optimizer searches over them.
+"""
+
+FERM_PERIOD = 14  # days after buy/claim during which no xp or br is earned
+DAYS_TO_TIER_UP = [14, 42, 99999]  # cummulative days after FP needed to tier up (T2, T3, T4)
+TIER_MEAD_PROD = [2, 3, 4]  # mead/day (resp. to tier)
+BR_PER_DAY = 20  # BR/day after fermentation period
+
+_TIER_UPS = DAYS_TO_TIER_UP[:-1]  # the last threshold is never reached
+MAX_DAYS_AFTER_CLAIM = FERM_PERIOD
+MAX_DAYS_AFTER_FP = _TIER_UPS[-1] + 1
+_MEAD_PROD = [TIER_MEAD_PROD[sum(dafp > days for days in _TIER_UPS)] for dafp in range(MAX_DAYS_AFTER_FP + 1)]
+
+
+def compress(brewery_states):
+    """ :param brewery_states: (days after claim, days after fermentation period, mead) of every brewery
+        :return: cohorts, i.e. sorted tuple of ((days after claim, days after fp), number of breweries)
+    """
+    cohorts = {}
+    for days_after_claim, days_after_fp, _ in brewery_states:
+        key = (min(days_after_claim, MAX_DAYS_AFTER_CLAIM), min(days_after_fp, MAX_DAYS_AFTER_FP))
+        cohorts[key] = cohorts.get(key, 0) + 1
+    return tuple(sorted(cohorts.items()))
+
+
+def run_day(cohorts):
+    """ Runs all cohorts for one day
+
+    :return: new cohorts, mead produced, br earned
+    """
+    new_cohorts = {}
+    mead = 0
+    br = 0
+    for (days_after_claim, days_after_fp), n in cohorts:
+        if days_after_claim + 1 > FERM_PERIOD:
+            days_after_fp = min(days_after_fp + 1, MAX_DAYS_AFTER_FP)
+            br += n*BR_PER_DAY
+        mead += n*_MEAD_PROD[days_after_fp]
+        key = (min(days_after_claim + 1, MAX_DAYS_AFTER_CLAIM), days_after_fp)
+        new_cohorts[key] = new_cohorts.get(key, 0) + n
+    return tuple(sorted(new_cohorts.items())), mead, br
+
+
+def run_days(cohorts, days):
+    """ Runs all cohorts for `days` days at once (like run_day `days` times)
+
+    :return: new cohorts, mead produced, br earned
+    """
+    new_cohorts = {}
+    mead = 0
+    br = 0
+    for (days_after_claim, days_after_fp), n in cohorts:
+        brewery_mead, brewery_br = hold_production(days_after_claim, days_after_fp, days)
+        mead += n*brewery_mead
+        br += n*brewery_br
+        progress = max(0, days - max(0, FERM_PERIOD - days_after_claim))
+        key = (min(days_after_claim + days, MAX_DAYS_AFTER_CLAIM), min(days_after_fp + progress, MAX_DAYS_AFTER_FP))
+        new_cohorts[key] = new_cohorts.get(key, 0) + n
+    return tuple(sorted(new_cohorts.items())), mead, br
+
+
+def hold_production(days_after_claim, days_after_fp, days):
+    """ :return: mead produced and br earned by one brewery when holding for `days` days """
+    fermenting = max(0, FERM_PERIOD - days_after_claim)  # days left without progress
+    days_up_to = [min(days, fermenting + days_to_tier_up - days_after_fp) if days_after_fp <= days_to_tier_up else 0
+                  for days_to_tier_up in _TIER_UPS]  # days spent at or below each tier threshold
+    days_per_tier = [b - a for a, b in zip([0] + days_up_to, days_up_to + [days])]
+    return sum(d*prod for d, prod in zip(days_per_tier, TIER_MEAD_PROD)), BR_PER_DAY*max(0, days - fermenting)
+
+
+def production_changes(cohorts, days):
+    """ :return: sorted days (1 to `days`) on which the daily mead production of the cohorts differs from the day
+                 before, when holding
+    """
+    changes = set()
+    for (days_after_claim, days_after_fp), _ in cohorts:
+        fermenting = max(0, FERM_PERIOD - days_after_claim)
+        for days_to_tier_up in _TIER_UPS:
+            day = fermenting + days_to_tier_up + 1 - days_after_fp  # first day after the tier up
+            if 1 < day <= days:
+                changes.add(day)
+    return sorted(changes)
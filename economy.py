@@ -0,0 +1,228 @@
+""" Economy of many players sharing one MEAD market and one brewery supply
+
+Players (agents) of all strategies are simulated together in one CohortBatch. Every day they act on a brewery
+price set by the market, sell part of the MEAD they added to their wallets into a shared constant-product pool,
+and the next day's MEAD price and brewery price follow from the pool and the total number of breweries.
+
+Example:
+    python economy.py --agents 10000 --days 365 --mix "compound when possible=0.5,claim daily=0.3,hodl=0.2"
+"""
+import argparse
+
+import numpy as np
+
+from engine import CohortBatch
+from strategies import CLAIM, COMPOUND, STRATEGIES, get_strategy
+
+SERIES = ("mead_price", "brewery_price", "breweries", "unclaimed_mead", "mead_in_wallet", "mead_sold")
+
+
+class Market:
+    """ Constant-product pool of MEAD and USD (reserves multiply to a constant), price in USD per MEAD """
+
+    def __init__(self, liquidity=1e6, mead_price=1.):
+        """
+        :param liquidity: USD in the pool
+        :param mead_price: initial price of one MEAD in USD
+        """
+        self.usd_reserve = float(liquidity)
+        self.mead_reserve = liquidity/mead_price
+        self._k = self.usd_reserve*self.mead_reserve
+
+    @property
+    def price(self):
+        return self.usd_reserve/self.mead_reserve
+
+    def sell(self, mead):
+        """ :return: USD paid for `mead` MEAD """
+        self.mead_reserve += mead
+        usd = self.usd_reserve - self._k/self.mead_reserve
+        self.usd_reserve -= usd
+        return usd
+
+    def buy(self, usd):
+        """ :return: MEAD bought for `usd` USD """
+        self.usd_reserve += usd
+        mead = self.mead_reserve - self._k/self.usd_reserve
+        self.mead_reserve -= mead
+        return mead
+
+
+def _assign(agents, strategies):
+    """ Splits agents into consecutive groups proportional to the strategy shares (largest remainder)
+
+    :return: list of (strategy as given, Strategy, slice of agents)
+    """
+    shares = np.array(list(strategies.values()), dtype=float)
+    if len(shares) == 0 or (shares < 0).any() or shares.sum() <= 0:
+        raise ValueError("Strategy shares must be non-negative and not all zero.")
+    exact = agents*shares/shares.sum()
+    counts = np.floor(exact).astype(int)
+    counts[np.argsort(counts - exact)[:agents - counts.sum()]] += 1
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    return [(strategy, get_strategy(strategy), slice(int(start), int(stop)))
+            for strategy, start, stop in zip(strategies, bounds[:-1], bounds[1:])]
+
+
+class Tavern:
+    """ Many players with mixed strategies, a shared MEAD market and a brewery price following supply
+
+    Each day:
+    1. every player runs their breweries and acts on the brewery price of the day (in MEAD),
+    2. players sell sell_fraction of the MEAD their action added to their wallets into the market,
+    3. outside buyers spend `inflow` USD on MEAD,
+    4. the brewery price is brewery_usd_price/(MEAD price), times (breweries/initial breweries)**supply_elasticity.
+    """
+
+    def __init__(self, agents=10000, days=365, strategies=None, num_breweries=1, br=0, brewery_price=100.,
+                 mead_price=1., liquidity=1e6, sell_fraction=0.5, inflow=0., supply_elasticity=0.):
+        """
+        :param agents: number of players
+        :param days: maximum number of days the tavern will run
+        :param strategies: dict of strategy (name from STRATEGIES, schedule text or Strategy) -> share of players
+                           (default: equal shares of STRATEGIES)
+        :param num_breweries: initial breweries per player (scalar or one value per player)
+        :param br: initial BR per player (scalar or one value per player)
+        :param brewery_price: initial price of one brewery in MEAD
+        :param mead_price: initial price of one MEAD in USD
+        :param liquidity: USD in the market pool
+        :param sell_fraction: share of MEAD added to wallets that players sell right away
+        :param inflow: USD outside buyers spend on MEAD every day
+        :param supply_elasticity: how strongly the brewery price rises with the number of breweries
+        """
+        self.days = days
+        self.sell_fraction = sell_fraction
+        self.inflow = inflow
+        self.supply_elasticity = supply_elasticity
+        self.groups = _assign(agents, strategies or {name: 1. for name in STRATEGIES})
+        self.batch = CohortBatch(agents, days, num_breweries, br)
+        self.market = Market(liquidity, mead_price)
+        self.usd = np.zeros(agents)  # USD each player got for selling MEAD
+
+        self._brewery_usd_price = brewery_price*mead_price
+        self._initial_breweries = max(1, int(self.batch.num_breweries.sum()))
+        self._series = {name: np.empty(days + 1) for name in SERIES}
+        self._record(0.)
+
+    @property
+    def day(self):
+        return self.batch.day
+
+    @property
+    def brewery_price(self):
+        """ Price of one brewery in MEAD today """
+        supply = max(1, int(self.batch.num_breweries.sum()))/self._initial_breweries
+        return self._brewery_usd_price/self.market.price*supply**self.supply_elasticity
+
+    def _record(self, mead_sold):
+        day = self.batch.day
+        self._series["mead_price"][day] = self.market.price
+        self._series["brewery_price"][day] = self.brewery_price
+        self._series["breweries"][day] = self.batch.num_breweries.sum()
+        self._series["unclaimed_mead"][day] = self.batch.unclaimed_mead.sum()
+        self._series["mead_in_wallet"][day] = self.batch.mead_in_wallet.sum()
+        self._series["mead_sold"][day] = mead_sold
+
+    def run_day(self):
+        if self.day >= self.days:
+            raise ValueError(f"Tavern was set up for {self.days} days.")
+        batch = self.batch
+        price = self.brewery_price
+        compound = np.zeros(batch.size, dtype=bool)
+        claim = np.zeros(batch.size, dtype=bool)
+        for _, strategy, agents in self.groups:
+            action = strategy.action(batch.day)
+            if action == COMPOUND:
+                compound[agents] = True
+            elif action == CLAIM:
+                claim[agents] = True
+
+        wallet = batch.mead_in_wallet.copy()
+        batch.run_day()
+        if compound.any():
+            batch.compound(price, compound)
+        if claim.any():
+            batch.claim_all_and_tax_to_wallet(claim)
+
+        sold = (batch.mead_in_wallet - wallet)*self.sell_fraction
+        mead_sold = sold.sum()
+        if mead_sold > 0:
+            batch.mead_in_wallet -= sold
+            self.usd += self.market.sell(mead_sold)*sold/mead_sold
+        if self.inflow:
+            self.market.buy(self.inflow)
+        self._record(mead_sold)
+
+    def run(self, days=None):
+        """ Runs the remaining (or the next `days`) days
+
+        :return: dict with "day" and SERIES, each an array over the days run so far
+        """
+        last_day = self.days if days is None else min(self.days, self.day + days)
+        while self.day < last_day:
+            self.run_day()
+        return {"day": np.arange(self.day + 1), **{name: values[:self.day + 1] for name, values in
+                                                    self._series.items()}}
+
+    def net_worth(self):
+        """ :return: USD from sales plus wallet MEAD at today's price, per player """
+        return self.usd + self.batch.mead_in_wallet*self.market.price
+
+    def summary(self):
+        """ :return: dict of strategy (as given) -> dict with players, mean breweries, mean wallet MEAD and mean
+                     net worth (USD)
+        """
+        net_worth = self.net_worth()
+        return {str(name): {"players": agents.stop - agents.start,
+                            "breweries": float(self.batch.num_breweries[agents].mean()),
+                            "mead_in_wallet": float(self.batch.mead_in_wallet[agents].mean()),
+                            "net_worth": float(net_worth[agents].mean())}
+                for name, _, agents in self.groups if agents.stop > agents.start}
+
+
+def _parse_mix(text):
+    """ "name=share,name=share" -> dict (shares default to 1) """
+    mix = {}
+    for part in text.split(","):
+        name, _, share = part.partition("=")
+        mix[name.strip()] = float(share) if share else 1.
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Players with mixed strategies on a shared MEAD market.")
+    parser.add_argument("--agents", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--mix", default=",".join(STRATEGIES),
+                        help="strategy=share pairs, e.g. 'compound when possible=0.5,claim daily=0.3,hodl=0.2'")
+    parser.add_argument("--breweries", type=int, default=1, help="initial breweries per player")
+    parser.add_argument("--br", type=int, default=0, help="initial BR per player")
+    parser.add_argument("--brewery-price", type=float, default=100., help="initial brewery price (MEAD)")
+    parser.add_argument("--mead-price", type=float, default=1., help="initial MEAD price (USD)")
+    parser.add_argument("--liquidity", type=float, default=1e6, help="USD in the market pool")
+    parser.add_argument("--sell-fraction", type=float, default=0.5)
+    parser.add_argument("--inflow", type=float, default=0., help="USD spent on MEAD by outside buyers per day")
+    parser.add_argument("--supply-elasticity", type=float, default=0.)
+    parser.add_argument("--daily", action="store_true", help="print the market series per day as CSV")
+    args = parser.parse_args(argv)
+    try:
+        tavern = Tavern(args.agents, args.days, _parse_mix(args.mix), args.breweries, args.br, args.brewery_price,
+                        args.mead_price, args.liquidity, args.sell_fraction, args.inflow, args.supply_elasticity)
+    except ValueError as e:
+        parser.error(str(e))
+
+    series = tavern.run()
+    if args.daily:
+        print("day," + ",".join(SERIES))
+        for day in series["day"]:
+            print(f"{day}," + ",".join(f"{series[name][day]:.4f}" for name in SERIES))
+        return
+    print(f"Day {tavern.day}: MEAD {tavern.market.price:.4f} USD, brewery {tavern.brewery_price:.2f} MEAD, "
+          f"{int(series['breweries'][-1])} breweries")
+    for strategy, stats in tavern.summary().items():
+        print(f"{strategy:>20}: {stats['players']:>6} players, {stats['breweries']:>8.1f} breweries, "
+              f"{stats['mead_in_wallet']:>10.2f} MEAD in wallet, {stats['net_worth']:>10.2f} USD net worth")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+from classes import Brewery, Player
+from instrumentation import PROFILER
+
+
+class BreweryTable:
+    """ Brewery state stored column-wise in typed NumPy arrays (one row per brewery, in order of purchase)
+
+    The row is the integer id of a brewery, see BreweryIndex for the string ids of Player.
+    """
+    __ferm_period = Brewery._Brewery__ferm_period
+    __days_to_tier_up = np.array(Brewery._Brewery__days_to_tier_up)
+    __tier_mead_prod = np.array(Brewery._Brewery__tier_mead_prod)
+    __br_per_day = Brewery._Brewery__br_per_day
+    __columns = ("_price", "_mead", "_days_after_claim", "_days_after_fp", "_tier", "_age")
+    __dtypes = (np.int64, np.int64, np.int32, np.int32, np.int8, np.int32)  # 29 bytes per brewery
+
+    def __init__(self, capacity=16):
+        self._size = 0
+        for col, dtype in zip(self.__columns, self.__dtypes):
+            setattr(self, col, np.zeros(capacity, dtype=dtype))
+        # running aggregates, so claiming all and counting tiers don't need a pass over the columns
+        self._total_mead = 0
+        self._tier_counts = [0]*len(self.__tier_mead_prod)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        """ Bytes allocated for the columns (the full capacity) """
+        return sum(getattr(self, col).nbytes for col in self.__columns)
+
+    def _grow(self, size):
+        """ Doubles the capacity of all columns until size rows fit """
+        capacity = len(self._price)
+        while capacity < size:
+            capacity *= 2
+        for col in self.__columns:
+            old = getattr(self, col)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, col, new)
+
+    def add(self, price=Brewery.price_default):
+        """ Appends a new brewery (same initial state as Brewery(price))
+
+        :return: row index of the new brewery
+        """
+        return self.add_many(1, price).start
+
+    def add_many(self, n, price=Brewery.price_default):
+        """ Appends a cohort of n new breweries (same initial state as Brewery(price))
+
+        :return: range of the row indices of the new breweries
+        """
+        if self._size + n > len(self._price):
+            self._grow(self._size + n)
+        rows = range(self._size, self._size + n)
+        self._price[rows.start:rows.stop] = Brewery.checked_price(price)  # other columns are zero
+        self._tier_counts[0] += n
+        self._size += n
+        return rows
+
+    def run_day(self):
+        """ Runs all breweries for one day (vectorized Brewery.run_day)
+
+        :return: mead produced, br earned, number of breweries per tier
+        """
+        n = self._size
+        days_after_claim = self._days_after_claim[:n]
+        days_after_claim += 1
+        self._age[:n] += 1
+
+        # breweries after the fermentation period earn br and progress to the next tier
+        after_fp = days_after_claim > self.__ferm_period
+        days_after_fp = self._days_after_fp[:n]
+        days_after_fp += after_fp
+
+        tier = self._tier[:n]
+        tier_up = days_after_fp > self.__days_to_tier_up[tier]
+        if tier_up.any():
+            moved = np.bincount(tier[tier_up], minlength=len(self._tier_counts)).tolist()
+            self._tier_counts = [count - out + into for count, out, into in
+                                 zip(self._tier_counts, moved, [0] + moved[:-1])]
+            tier += tier_up
+
+        daily_mead_prod = self.__tier_mead_prod[tier]
+        self._mead[:n] += daily_mead_prod
+        mead = int(daily_mead_prod.sum())
+        self._total_mead += mead
+
+        return mead, self.__br_per_day*int(np.count_nonzero(after_fp)), list(self._tier_counts)
+
+    def days_to_next_event(self):
+        """ :return: number of upcoming days without any brewery event (vectorized Brewery.days_to_next_event) """
+        n = self._size
+        days_after_claim = self._days_after_claim[:n]
+        days_to_event = np.where(days_after_claim < self.__ferm_period,
+                                 self.__ferm_period - days_after_claim,
+                                 self.__days_to_tier_up[self._tier[:n]] - self._days_after_fp[:n])
+        return int(days_to_event.min())
+
+    def run_days(self, days):
+        """ Runs all breweries for a number of uneventful days (vectorized Brewery.run_days)
+
+        :return: mead produced per day, br earned per day, number of breweries per tier
+        """
+        n = self._size
+        days_after_claim = self._days_after_claim[:n]
+        after_fp = days_after_claim >= self.__ferm_period
+        self._days_after_fp[:n] += days*after_fp
+        days_after_claim += days
+        self._age[:n] += days
+
+        daily_mead_prod = self.__tier_mead_prod[self._tier[:n]]
+        self._mead[:n] += days*daily_mead_prod
+        mead = int(daily_mead_prod.sum())
+        self._total_mead += days*mead
+
+        return mead, self.__br_per_day*int(np.count_nonzero(after_fp)), list(self._tier_counts)
+
+    def claim(self, idx):
+        """ :return: untaxed mead claimed from brewery at row idx """
+        mead = int(self._mead[idx])
+        self._mead[idx] = 0
+        self._days_after_claim[idx] = 0
+        self._total_mead -= mead
+        return mead
+
+    def claim_all(self):
+        """ :return: untaxed mead claimed from all breweries """
+        n = self._size
+        mead = self._total_mead
+        self._mead[:n] = 0
+        self._days_after_claim[:n] = 0
+        self._total_mead = 0
+        return mead
+
+    def copy(self):
+        other = BreweryTable.__new__(BreweryTable)
+        other._size = self._size
+        for col in self.__columns:
+            setattr(other, col, getattr(self, col).copy())
+        other._total_mead = self._total_mead
+        other._tier_counts = list(self._tier_counts)
+        return other
+
+    def to_bytes(self):
+        """ :return: columns (price, mead, days after claim, days after fp, tier, age) as native int64 """
+        return b"".join(getattr(self, col)[:self._size].astype(np.int64).tobytes() for col in self.__columns)
+
+    @classmethod
+    def from_bytes(cls, data, size):
+        """ Inverse of to_bytes for `size` breweries """
+        table = cls(capacity=max(size, 16))
+        table._size = size
+        columns = np.frombuffer(data, dtype=np.int64).reshape(len(cls.__columns), size)
+        for col, values in zip(cls.__columns, columns):
+            getattr(table, col)[:size] = values
+        table._total_mead = int(table._mead[:size].sum())
+        table._tier_counts = np.bincount(table._tier[:size], minlength=len(table._tier_counts)).tolist()
+        return table
+
+    def total_price(self):
+        return int(self._price[:self._size].sum())
+
+    def states(self):
+        """ :return: list of (days after claim, days after fermentation period, mead) of every brewery """
+        n = self._size
+        return list(zip(self._days_after_claim[:n].tolist(), self._days_after_fp[:n].tolist(), self._mead[:n].tolist()))
+
+
+class BreweryIndex(Mapping):
+    """ Read-only mapping of the brewery ids of Player ("b00", "b01", ...) to rows of a BreweryTable
+
+    Ids are computed from rows rather than stored. The integer row works as id, too.
+    """
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, brewery_id):
+        if isinstance(brewery_id, str) and brewery_id[1:].isdigit():
+            row = int(brewery_id[1:])
+            if brewery_id != f"b{row:02d}":
+                raise KeyError(brewery_id)
+        elif isinstance(brewery_id, (int, np.integer)) and not isinstance(brewery_id, bool):
+            row = int(brewery_id)
+        else:
+            raise KeyError(brewery_id)
+        if not 0 <= row < len(self._table):
+            raise KeyError(brewery_id)
+        return row
+
+    def __iter__(self):
+        return (f"b{row:02d}" for row in range(len(self._table)))
+
+    def __len__(self):
+        return len(self._table)
+
+
+class VectorPlayer(Player):
+    """ Player whose breweries live in a BreweryTable, so a whole day advances in a few array operations
+
+    Gives the same results as Player. self.breweries maps brewery ids to rows of the table.
+    """
+
+    @property
+    def breweries(self):
+        return BreweryIndex(self._brewery_table)
+
+    @property
+    def nbytes(self):
+        """ Bytes allocated for brewery columns and history """
+        return self._brewery_table.nbytes + self.history.nbytes
+
+    def _init_breweries(self):
+        self._brewery_table = BreweryTable()
+
+    def _run_breweries(self):
+        return self._brewery_table.run_day()
+
+    def _add_breweries(self, n, price):
+        self._brewery_table.add_many(n, price)
+
+    def _claim_brewery(self, brewery):
+        return self._brewery_table.claim(brewery)
+
+    def _claim_all_breweries(self):
+        return self._brewery_table.claim_all()
+
+    def _total_brewery_price(self):
+        return self._brewery_table.total_price()
+
+    def _brewery_states(self):
+        return self._brewery_table.states()
+
+    def _fork_breweries(self):
+        self._brewery_table = self._brewery_table.copy()
+
+    def _dump_breweries(self):
+        return self._brewery_table.to_bytes()
+
+    def _load_breweries(self, data, n):
+        self._brewery_table = BreweryTable.from_bytes(data, n)
+
+    def _days_to_next_event(self):
+        return self._brewery_table.days_to_next_event() if self.num_breweries else None
+
+    def _run_breweries_for_days(self, n):
+        return self._brewery_table.run_days(n)
+
+
+class CohortBatch:
+    """ Breweries of a batch of independent players, grouped into cohorts of breweries bought on the same day
+
+    Players of a batch always claim from all their breweries at once, so all cohorts of one player share the
+    days after claim, and the whole batch advances a day in a few array operations on (players, cohorts) arrays.
+    Cohort column d holds the breweries bought on day d (column 0 holds the initial breweries).
+    """
+    __ferm_period = Brewery._Brewery__ferm_period
+    __days_to_tier_up = np.array(Brewery._Brewery__days_to_tier_up)
+    __tier_mead_prod = np.array(Brewery._Brewery__tier_mead_prod)
+    __br_per_day = Brewery._Brewery__br_per_day
+    __br_per_buy = 10  # see Player.buy_breweries
+    __br_requirements = np.array(Player._Player__br_requirements)
+    __claim_taxes = np.array(Player._Player__claim_taxes)
+
+    def __init__(self, size, days, num_breweries=0, br=0, mead_in_wallet=0.):
+        """
+        :param size: number of players in the batch
+        :param days: maximum number of days the batch will run
+        :param num_breweries: initial breweries (scalar or one value per player)
+        :param br: initial BR (scalar or one value per player)
+        :param mead_in_wallet: initial wallet (scalar or one value per player)
+        """
+        self.size = size
+        self.day = 0
+        self._count = np.zeros((size, days + 1), dtype=np.int64)
+        self._days_after_fp = np.zeros((size, days + 1), dtype=np.int32)
+        self._tier = np.zeros((size, days + 1), dtype=np.int8)
+        self._count[:, 0] = num_breweries
+        self._cohorts = 1  # number of leading cohort columns holding any breweries
+
+        self.num_breweries = self._count[:, 0].copy()
+        self.days_after_claim = np.zeros(size, dtype=np.int64)
+        self.br = np.maximum(0, np.broadcast_to(br, size).astype(np.int64)) + self.__br_per_buy*self.num_breweries
+        self.unclaimed_mead = np.zeros(size)
+        self.mead_in_wallet = np.full(size, mead_in_wallet, dtype=float)
+
+        self.mead_factor = np.ones(size)  # multiplies mead production (reward shocks)
+        self.claim_tax_shift = np.zeros(size)  # added to the claim tax of the player's rank (tax shocks)
+
+    @property
+    def rank(self):
+        return np.searchsorted(self.__br_requirements, self.br, side="right") - 1
+
+    @property
+    def claim_tax(self):
+        return np.clip(self.__claim_taxes[self.rank] + self.claim_tax_shift, 0., 1.)
+
+    def brews_per_tier(self):
+        """ :return: (players, tiers) array with the number of breweries per tier """
+        cohorts = self._cohorts
+        tiers = np.arange(len(self.__tier_mead_prod))
+        return ((self._tier[:, :cohorts, None] == tiers)*self._count[:, :cohorts, None]).sum(axis=1)
+
+    def run_day(self):
+        """ Runs all breweries of all players for one day
+
+        :return: mead produced by each player
+        """
+        profiling = PROFILER.enabled  # see instrumentation
+        if profiling:
+            start = PROFILER.clock()
+        cohorts = self._cohorts
+        self.days_after_claim += 1
+        after_fp = self.days_after_claim > self.__ferm_period
+
+        days_after_fp = self._days_after_fp[:, :cohorts]
+        days_after_fp += after_fp[:, None]
+        tier = self._tier[:, :cohorts]
+        tier += days_after_fp > self.__days_to_tier_up[tier]
+
+        daily_mead = (self._count[:, :cohorts]*self.__tier_mead_prod[tier]).sum(axis=1)*self.mead_factor
+        self.unclaimed_mead += daily_mead
+        self.br += self.__br_per_day*after_fp*self.num_breweries
+        self.day += 1
+        if profiling:
+            PROFILER.add_time("breweries", start)
+            PROFILER.count("days", self.size)
+            PROFILER.count("breweries_processed", int(self.num_breweries.sum()))
+        return daily_mead
+
+    def _claim(self, mask):
+        profiling = PROFILER.enabled
+        if profiling:
+            start = PROFILER.clock()
+        claimed = np.where(mask, self.unclaimed_mead, 0.)
+        self.unclaimed_mead -= claimed
+        self.days_after_claim[mask] = 0
+        if profiling:
+            PROFILER.add_time("claim", start)
+            PROFILER.count("claims", int(np.count_nonzero(mask)))
+        return claimed
+
+    def _tax_to_wallet(self, claimed):
+        self.mead_in_wallet += claimed - claimed*self.claim_tax
+
+    def claim_all_and_tax_to_wallet(self, mask=True):
+        """ Claims all mead of players selected by mask and adds it to their wallets after tax
+
+        :return: untaxed mead claimed by each player
+        """
+        claimed = self._claim(np.broadcast_to(mask, self.size))
+        self._tax_to_wallet(claimed)
+        return claimed
+
+    def compound(self, price, mask=True):
+        """ Players selected by mask with more unclaimed mead than price claim everything, buy as many breweries
+            as possible (a new cohort) and add the rest to their wallets after tax (see Player.compound)
+
+        :param price: price of one brewery in MEAD (scalar or one value per player)
+        :return: number of breweries bought by each player
+        """
+        claimed = self._claim(np.broadcast_to(mask, self.size) & (self.unclaimed_mead > price))
+        profiling = PROFILER.enabled
+        if profiling:
+            start = PROFILER.clock()
+        bought = np.floor(claimed/price).astype(np.int64)
+        self._count[:, self.day] += bought
+        if bought.any():
+            self._cohorts = self.day + 1
+        self.num_breweries += bought
+        self.br += self.__br_per_buy*bought
+        if profiling:
+            PROFILER.add_time("buy", start)
+            PROFILER.count("buys", int(bought.sum()))
+        self._tax_to_wallet(claimed - bought*price)
+        return bought
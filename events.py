@@ -0,0 +1,123 @@
+from collections import deque
+from dataclasses import dataclass
+
+
+class Event:
+    """ Base class of everything Brewery and Player report """
+
+
+@dataclass(frozen=True)
+class DefaultPriceSet(Event):
+    day: int  # None for a Brewery created outside a Player
+    price: int
+
+    def __str__(self):
+        return f"Default price of {self.price} MEAD was set."
+
+
+@dataclass(frozen=True)
+class BreweryBought(Event):
+    day: int
+    brewery_id: str
+    price: int
+
+    def __str__(self):
+        return f"Succesfully bought Brewery {self.brewery_id} for {self.price} MEAD."
+
+
+@dataclass(frozen=True)
+class Claimed(Event):
+    day: int
+    brewery_id: str  # None if claimed from all breweries at once
+    mead: float  # before tax
+
+    def __str__(self):
+        source = "all breweries" if self.brewery_id is None else f"brewery {self.brewery_id}"
+        return f"Sucessfully claimed {self.mead:.2f} MEAD (before tax) from {source}."
+
+
+@dataclass(frozen=True)
+class UnknownBrewery(Event):
+    day: int
+    brewery_id: str
+
+    def __str__(self):
+        return f"Player doesn't own a brewery with id: {self.brewery_id}."
+
+
+@dataclass(frozen=True)
+class Taxed(Event):
+    day: int
+    mead: float  # before tax
+    claim_tax: float
+    mead_in_wallet: float  # new wallet balance
+
+    def __str__(self):
+        return (f"Taxed {self.mead} MEAD with tax of {self.claim_tax*100:.0f} %. "
+                f"New Wallet balance: {self.mead_in_wallet} MEAD.")
+
+
+@dataclass(frozen=True)
+class NothingToTax(Event):
+    day: int
+
+    def __str__(self):
+        return "No claimed mead to tax."
+
+
+@dataclass(frozen=True)
+class Compounded(Event):
+    day: int
+    breweries_bought: int
+    num_breweries: int  # new total
+
+    def __str__(self):
+        return f"Bought {self.breweries_bought} Breweries, with new total of {self.num_breweries} Breweries."
+
+
+@dataclass(frozen=True)
+class NotEnoughToCompound(Event):
+    day: int
+    unclaimed_mead: float
+
+    def __str__(self):
+        return "Not enough unclaimed mead to compound."
+
+
+class EventLog:
+    """ Sink for simulation events, keeping the last `capacity` of them (ring buffer)
+
+    Emitters check `enabled` before building an event, so a disabled log costs one attribute lookup.
+    """
+
+    def __init__(self, capacity=10000, echo=False, enabled=True):
+        """
+        :param capacity: number of events kept (None = unbounded)
+        :param echo: also print every event
+        :param enabled: capture events at all
+        """
+        self.enabled = enabled
+        self.echo = echo
+        self._events = deque(maxlen=capacity)
+
+    def __len__(self):
+        return len(self._events)
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def emit(self, event):
+        self._events.append(event)
+        if self.echo:
+            print(event)
+
+    def events(self, kind=Event):
+        """ :return: list of captured events of type `kind` (oldest first) """
+        return [event for event in self._events if isinstance(event, kind)]
+
+    def clear(self):
+        self._events.clear()
+
+
+# used by Brewery and by every Player created without an event_log, off by default
+default_log = EventLog(enabled=False)
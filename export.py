@@ -0,0 +1,256 @@
+""" Streaming export of Player histories to Parquet, Arrow IPC or CSV files, and a loader for them
+
+Parquet and Arrow need pyarrow. load() memory-maps Arrow IPC files, so data is paged in from disk as it is used.
+
+Example:
+    python export.py --breweries 1 5 10 --strategy hodl "claim daily" --days 365 -o histories.parquet
+"""
+import argparse
+import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from engine import VectorPlayer
+from history import History
+from strategies import STRATEGIES, get_strategy, run_strategy
+from sweep import PARAMETERS, scenario_grid
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for Parquet and Arrow files
+    pa = pq = None
+
+FORMATS = {".parquet": "parquet", ".pq": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow",
+           ".csv": "csv"}
+BATCH_ROWS = 65536  # rows held in memory before they are written
+RUNS_PER_WORKER = 2  # runs write_sweep keeps in flight per worker process
+
+
+def _file_format(path, file_format=None):
+    file_format = file_format or FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format not in FORMATS.values():
+        raise ValueError(f"Unknown file format of {path}. Choose from {tuple(sorted(set(FORMATS.values())))}.")
+    if file_format != "csv" and pa is None:
+        raise ImportError(f"Writing and reading {file_format} files needs pyarrow (pip install pyarrow).")
+    return file_format
+
+
+class HistoryWriter:
+    """ Writes history rows, prefixed by constant scenario columns, to one file in batches of batch_rows rows
+
+    At most one batch is held in memory. Use as a context manager or call close() to write the last batch.
+    """
+
+    def __init__(self, path, file_format=None, scenario_columns=(), batch_rows=BATCH_ROWS):
+        """
+        :param path: output file
+        :param file_format: "parquet", "arrow" or "csv" (default: from the file extension)
+        :param scenario_columns: names of the columns identifying a run (e.g. sweep.PARAMETERS)
+        :param batch_rows: rows per written batch (Parquet row group / Arrow record batch)
+        """
+        self.path = path
+        self.file_format = _file_format(path, file_format)
+        self.columns = tuple(scenario_columns) + History.columns
+        self.batch_rows = batch_rows
+        self.rows = 0  # rows written so far
+        self._scenario_columns = tuple(scenario_columns)
+        self._batch = {name: [] for name in self.columns}
+        self._batch_size = 0
+        self._schema = None
+        self._writer = None
+        self._file = None
+        if self.file_format == "csv":
+            self._file = open(path, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, history, start=0, stop=None, **scenario):
+        """ Appends rows [start:stop] of history
+
+        :param scenario: value of every scenario column for these rows
+        :return: number of rows appended
+        """
+        if set(scenario) != set(self._scenario_columns):
+            raise ValueError(f"Expected values for the scenario columns {self._scenario_columns}.")
+        data = history.slice(start, stop)
+        n = len(data["day"])
+        for name in self._scenario_columns:
+            self._batch[name].append(np.full(n, scenario[name]))
+        for name in History.columns:
+            self._batch[name].append(np.array(data[name]))  # copy, history rows may change later
+        self._batch_size += n
+        if self._batch_size >= self.batch_rows:
+            self.flush()
+        return n
+
+    def flush(self):
+        """ Writes the rows held in memory """
+        if not self._batch_size:
+            return
+        columns = {name: np.concatenate(arrays) for name, arrays in self._batch.items()}
+        if self.file_format == "csv":
+            self._writer.writerows(zip(*(values.tolist() for values in columns.values())))
+        else:
+            table = pa.table(columns, schema=self._schema)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.file_format == "parquet":
+                    self._writer = pq.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            if self.file_format == "parquet":
+                self._writer.write_table(table, row_group_size=self.batch_rows)
+            else:
+                self._writer.write_table(table, max_chunksize=self.batch_rows)
+        self.rows += self._batch_size
+        self._batch = {name: [] for name in self.columns}
+        self._batch_size = 0
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        elif self._writer is not None:
+            self._writer.close()
+        self._writer = None
+
+
+def stream_run(player, strategy, days, writer, brewery_price=100, chunk_days=BATCH_ROWS, **scenario):
+    """ Runs player like strategies.run_strategy and writes its history rows as they are produced
+
+    Rows start with the day the run starts from.
+
+    :param writer: HistoryWriter
+    :param chunk_days: days run between writes
+    :param scenario: values of the writer's scenario columns
+    """
+    start = len(player.history) - 1
+    last_day = player.day + days
+    while player.day < last_day:
+        run_strategy(player, strategy, min(chunk_days, last_day - player.day), brewery_price)
+        writer.write(player.history, start, **scenario)
+        start = len(player.history)
+
+
+def _run_history(scenario):
+    """ Simulates one sweep scenario (see sweep.run_scenario)
+
+    :return: number of history rows, history as bytes (compact to send between processes)
+    """
+    player = VectorPlayer(scenario["num_breweries"], scenario["price"], scenario["br"], name="export")
+    run_strategy(player, scenario["strategy"], scenario["days"], scenario["compound_price"])
+    return len(player.history), player.history.to_bytes()
+
+
+def write_sweep(scenarios, path, file_format=None, max_workers=None, batch_rows=BATCH_ROWS,
+                runs_per_worker=RUNS_PER_WORKER):
+    """ Runs scenarios over a process pool and writes the histories of all of them to one file, in order
+
+    At most runs_per_worker*max_workers runs are in flight (running or finished but not written yet), so memory
+    stays bounded however many scenarios there are.
+
+    :param scenarios: iterable of scenarios (see sweep.scenario_grid)
+    :return: number of rows written
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    with HistoryWriter(path, file_format, PARAMETERS, batch_rows) as writer:
+
+        def write(scenario, size, data):
+            writer.write(History.from_bytes(data, size), **{name: scenario[name] for name in PARAMETERS})
+
+        if max_workers == 1:
+            for scenario in scenarios:
+                write(scenario, *_run_history(scenario))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                in_flight = deque()  # (scenario, future) in the order of scenarios
+                try:
+                    for scenario in scenarios:
+                        if len(in_flight) >= runs_per_worker*max_workers:
+                            write(in_flight[0][0], *in_flight.popleft()[1].result())
+                        in_flight.append((scenario, executor.submit(_run_history, scenario)))
+                    while in_flight:
+                        write(in_flight[0][0], *in_flight.popleft()[1].result())
+                finally:
+                    for _, future in in_flight:
+                        future.cancel()
+    return writer.rows
+
+
+def _parse(value):
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            pass
+    return value
+
+
+def load(path, file_format=None, columns=None):
+    """ Reads a file written by HistoryWriter
+
+    Arrow IPC files are memory-mapped (numeric columns of a file with a single record batch are not even copied),
+    Parquet files are read with memory mapping, CSV files are parsed.
+
+    :param columns: names of the columns to read (default: all)
+    :return: dict of column name -> NumPy array
+    """
+    file_format = _file_format(path, file_format)
+    if file_format == "csv":
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            values = list(zip(*reader)) or [()]*len(header)
+        return {name: np.array([_parse(value) for value in column])
+                for name, column in zip(header, values) if columns is None or name in columns}
+    if file_format == "parquet":
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a grid of scenarios and write the history of every run.")
+    parser.add_argument("--breweries", type=int, nargs="+", default=[1], help="initial number of breweries")
+    parser.add_argument("--price", type=int, nargs="+", default=[100], help="price per initial brewery (MEAD)")
+    parser.add_argument("--br", type=int, nargs="+", default=[0], help="initial BR")
+    parser.add_argument("--strategy", nargs="+", default=list(STRATEGIES),
+                        help=f"strategy name {tuple(STRATEGIES)} or schedule, e.g. hodl:29,compound:30,claim:60")
+    parser.add_argument("--days", type=int, nargs="+", default=[365], help="horizon in days")
+    parser.add_argument("--compound-price", type=int, nargs="+", default=[100], help="brewery price when compounding")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-o", "--output", required=True, help="output file (.parquet, .arrow or .csv)")
+    parser.add_argument("--format", default=None, choices=sorted(set(FORMATS.values())),
+                        help="file format (default: from the output extension)")
+    args = parser.parse_args(argv)
+    for strategy in args.strategy:
+        try:
+            get_strategy(strategy)
+        except ValueError as e:
+            parser.error(str(e))
+    try:
+        _file_format(args.output, args.format)
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+
+    scenarios = scenario_grid(args.breweries, args.price, args.br, args.strategy, args.days, args.compound_price)
+    rows = write_sweep(scenarios, args.output, args.format, max_workers=args.workers)
+    print(f"Wrote {rows} rows of {len(scenarios)} runs to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
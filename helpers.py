@@ -66,6 +66,23 @@ def update_output_values(player, **kwargs):
         kwargs["unclaimed_mead"].text = str(player.unclaimed_mead)
     if "wallet_mead" in kwargs.keys():
         kwargs["wallet_mead"].text = str(player.mead_in_wallet)
+    if "break_even" in kwargs.keys():
+        day = player.analytics.break_even_day
+        kwargs["break_even"].text = "-" if day is None else str(day)
+    if "apr" in kwargs.keys():
+        apr = player.analytics.apr
+        kwargs["apr"].text = "-" if apr is None else f"{apr:.0f} %"
+    if "vs_hodl" in kwargs.keys():
+        kwargs["vs_hodl"].text = f"{player.analytics.vs_hodl:+.2f} (max. drawdown {player.analytics.max_drawdown_vs_hodl:.2f})"
+
+
+def update_profile_div(div, profiler):
+    """ Shows the timers and counters of an instrumentation.Profiler as an HTML table in div """
+    data = profiler.to_dict()
+    rows = "".join(f"<tr><td>{phase}</td><td>{stats['seconds']*1000:.1f} ms</td><td>{stats['share']*100:.0f} %</td>"
+                   f"<td>{stats['calls']}</td></tr>" for phase, stats in data["phases"].items())
+    rows += "".join(f"<tr><td>{counter}</td><td colspan='3'>{n}</td></tr>" for counter, n in data["counters"].items())
+    div.text = f"<table><tr><th>phase</th><th>time</th><th>share</th><th>calls</th></tr>{rows}</table>"
 
 
 def append_l2(num_brws_list: list, num_brw_now: list):
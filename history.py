@@ -0,0 +1,114 @@
+import copy
+from array import array
+
+
+class History:
+    """ Daily Player values stored column-wise in typed arrays (one row per day)
+
+    Capacity doubles when full, so appends are amortized O(1) and values are stored unboxed.
+    Columns are returned as zero-copy memoryviews (np.asarray(view) wraps them without copying); a view keeps
+    showing the old buffer after the capacity grows, so take fresh views after appending.
+    fork() shares the arrays copy-on-write: a History copies them before its first change after a fork.
+    """
+    columns = ("day", "t1", "t2", "t3", "unclaimed_mead", "mead_in_wallet")
+    __typecodes = ("q", "q", "q", "q", "d", "d")  # int64 and float64
+
+    def __init__(self, capacity=64):
+        self._size = 0
+        self._capacity = max(1, capacity)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self._arrays = [array(tc, bytes(self._capacity*array(tc).itemsize)) for tc in self.__typecodes]
+        self._shared = False  # arrays are shared with a fork
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        """ Bytes allocated for the arrays (the full capacity) """
+        return sum(arr.itemsize*len(arr) for arr in self._arrays)
+
+    def __getitem__(self, name):
+        """ :return: zero-copy view of column `name` """
+        return memoryview(self._arrays[self._index[name]])[:self._size]
+
+    def _reserve(self, size):
+        """ Doubles the capacity until `size` rows fit, copies shared arrays before they are written to """
+        if size <= self._capacity:
+            if self._shared:
+                self._arrays = [arr[:] for arr in self._arrays]
+                self._shared = False
+            return
+        capacity = self._capacity
+        while capacity < size:
+            capacity *= 2
+        self._arrays = [arr + array(arr.typecode, bytes((capacity - self._capacity)*arr.itemsize))
+                        for arr in self._arrays]
+        self._capacity = capacity
+        self._shared = False
+
+    def append(self, *values):
+        """ Appends one row, values in the order of History.columns """
+        self._reserve(self._size + 1)
+        for arr, value in zip(self._arrays, values):
+            arr[self._size] = value
+        self._size += 1
+
+    def extend(self, n, **columns):
+        """ Appends n rows at once
+
+        :param n: number of rows
+        :param columns: iterable of n values for every column in History.columns
+        """
+        self._reserve(self._size + n)
+        for name, values in columns.items():
+            arr = self._arrays[self._index[name]]
+            values = array(arr.typecode, values)
+            if len(values) != n:
+                raise ValueError(f"Expected {n} values for column {name}, got {len(values)}.")
+            arr[self._size:self._size + n] = values
+        self._size += n
+
+    def set_last(self, name, value):
+        """ Overwrites the value of column `name` in the last row """
+        self._reserve(self._size)
+        self._arrays[self._index[name]][self._size - 1] = value
+
+    def last(self, name):
+        return self._arrays[self._index[name]][self._size - 1]
+
+    def slice(self, start=0, stop=None, columns=columns):
+        """ Zero-copy views of rows [start:stop], e.g. for ColumnDataSource.stream
+
+        :return: dict of column name -> memoryview
+        """
+        return {name: self[name][start:stop] for name in columns}
+
+    def fork(self):
+        """ :return: History with the same rows, sharing the arrays copy-on-write """
+        other = copy.copy(self)
+        other._arrays = list(self._arrays)
+        self._shared = other._shared = True
+        return other
+
+    def to_bytes(self):
+        """ :return: rows in native byte order, column after column """
+        return b"".join(self[name].tobytes() for name in self.columns)
+
+    @classmethod
+    def from_bytes(cls, data, size):
+        """ Inverse of to_bytes for a History with `size` rows """
+        history = cls(capacity=size)
+        history._size = size
+        offset = 0
+        for arr in history._arrays:
+            n_bytes = size*arr.itemsize
+            values = array(arr.typecode)
+            values.frombytes(data[offset:offset + n_bytes])
+            arr[:size] = values
+            offset += n_bytes
+        return history
+
+    def to_dict(self):
+        """ :return: dict of column name -> list (copy) """
+        return {name: self[name].tolist() for name in self.columns}
@@ -0,0 +1,121 @@
+""" Opt-in per-phase timers and counters of the simulation
+
+Instrumented code reads `profiler.enabled` once per call before it measures anything, so the disabled PROFILER
+costs an attribute lookup and a few branches per phase (like events.EventLog). Phases don't nest, so their times
+add up to the time spent in instrumented code.
+
+Example:
+    from instrumentation import PROFILER
+    PROFILER.enable()
+    run_sweep(scenarios, max_workers=1)
+    PROFILER.dump("profile.json")
+"""
+import json
+import time
+from contextlib import nullcontext
+
+PHASES = ("breweries",  # running breweries (Player._run_breweries, _run_breweries_for_days, CohortBatch.run_day)
+          "rank",  # adding BR and updating the rank (Player.br)
+          "claim",  # claiming mead from breweries
+          "buy",  # buying breweries
+          "history",  # appending days to the history
+          "analytics",  # updating Player.analytics
+          "bokeh_stream")  # sending history rows to the Bokeh data sources (main.py)
+COUNTERS = ("days",  # days simulated (per player)
+            "breweries_processed",  # brewery-days simulated (breweries times days run)
+            "claims",  # claims (from one or from all breweries of a player)
+            "buys")  # breweries bought
+
+_NO_TIMER = nullcontext()
+
+
+class _Timer:
+    __slots__ = ("profiler", "phase", "start")
+
+    def __init__(self, profiler, phase):
+        self.profiler = profiler
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = self.profiler.clock()
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_time(self.phase, self.start)
+
+
+class Profiler:
+    """ Accumulates seconds and calls per phase, and counters (see PHASES and COUNTERS, others may be added) """
+
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """ Zeroes all timers and counters """
+        self.seconds = dict.fromkeys(PHASES, 0.)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def add_time(self, phase, start):
+        """ Adds the time since `start` (a clock() value) to phase
+
+        :return: clock() now, the start of the next phase
+        """
+        now = self.clock()
+        self.seconds[phase] = self.seconds.get(phase, 0.) + now - start
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        return now
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def timed(self, phase):
+        """ :return: context manager adding the time spent in it to phase (does nothing while disabled) """
+        return _Timer(self, phase) if self.enabled else _NO_TIMER
+
+    def to_dict(self):
+        """ :return: JSON-serializable dict with "phases" (phase -> seconds, calls, share of the total time),
+                     "counters" and "total_seconds"
+        """
+        total = sum(self.seconds.values())
+        return {"phases": {phase: {"seconds": seconds, "calls": self.calls[phase],
+                                   "share": seconds/total if total else 0.}
+                           for phase, seconds in self.seconds.items()},
+                "counters": dict(self.counters),
+                "total_seconds": total}
+
+    def merge(self, data):
+        """ Adds the timers and counters of a to_dict() result (e.g. of a worker process) """
+        for phase, stats in data["phases"].items():
+            self.seconds[phase] = self.seconds.get(phase, 0.) + stats["seconds"]
+            self.calls[phase] = self.calls.get(phase, 0) + stats["calls"]
+        for counter, n in data["counters"].items():
+            self.count(counter, n)
+
+    def dump(self, file):
+        """ Writes to_dict() as JSON to a path or a text file object """
+        if isinstance(file, str):
+            with open(file, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
+        else:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def report(self):
+        """ :return: the timers and counters as a text table """
+        data = self.to_dict()
+        lines = [f"{phase:>14}: {stats['seconds']*1000:10.1f} ms {stats['share']*100:5.1f} % {stats['calls']:>10} calls"
+                 for phase, stats in data["phases"].items()]
+        lines += [f"{counter:>20}: {n}" for counter, n in data["counters"].items()]
+        return "\n".join(lines)
+
+
+# shared by everything instrumented in this process, off by default
+PROFILER = Profiler()
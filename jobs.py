@@ -0,0 +1,255 @@
+""" Asynchronous simulation jobs with progress events and cancellation
+
+A job runs a player like strategies.run_strategy, in chunks of progress_days days. Every chunk runs in a worker
+pool from a state snapshot of the player (through the worker's cache.CACHE) and the history rows and state it
+returns are applied to the player in the event loop, so jobs share the workers chunk by chunk instead of queueing
+behind each other. After every chunk the job reports a Progress event. Don't touch the player of a running job.
+
+The Bokeh app (main.py) and scripts use the same interface, e.g.:
+
+    async def main():
+        job = JOBS.submit_scenario({"num_breweries": 5, "price": 100, "br": 0, "strategy": "hodl",
+                                    "days": 3650, "compound_price": 100})
+        async for progress in job.progress():
+            print(f"{progress.days_done}/{progress.days} days")
+        player = await job
+
+    asyncio.run(main())
+
+Chunks don't emit events to the player's event log, so players with an enabled event log can't be submitted (run
+them with strategies.run_strategy instead). A player runs one job at a time. If a worker process dies (e.g. killed
+for running out of memory), the job running on it fails and the next chunk starts a new worker pool.
+"""
+import asyncio
+import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from cache import CACHE, _apply, _rows, _state_bytes
+from classes import Brewery
+from engine import VectorPlayer
+from instrumentation import PROFILER
+from strategies import get_strategy
+
+PENDING, RUNNING, DONE, CANCELLED, FAILED = "pending", "running", "done", "cancelled", "failed"
+FINAL_STATES = (DONE, CANCELLED, FAILED)
+PROGRESS_DAYS = 100  # default days run between progress events
+
+
+@dataclass(frozen=True)
+class Progress:
+    job_id: int
+    state: str
+    day: int  # day of the player
+    days_done: int  # days run by the job so far
+    days: int  # days the job runs in total
+
+    def __str__(self):
+        return f"Job {self.job_id} {self.state}: {self.days_done}/{self.days} days (day {self.day})."
+
+
+def _run_chunk(player_class, state, strategy, days, brewery_price, profile):
+    """ Runs a player restored from state (see cache._state_bytes) in a worker
+
+    :param profile: collect instrumentation timers and counters of the chunk
+    :return: history rows added, state after the run, PROFILER.to_dict() of the chunk (None unless profile)
+    """
+    player = player_class.from_bytes(state)
+    player.history.append(player.day, *player.brews_per_tier, player.unclaimed_mead, player.mead_in_wallet)
+    profile = profile and not PROFILER.enabled  # else the chunk runs in a thread and is profiled already
+    if profile:
+        PROFILER.reset()
+        PROFILER.enable()
+    try:
+        CACHE.run(player, strategy, days, brewery_price)
+    finally:
+        if profile:
+            PROFILER.disable()
+    return _rows(player.history, 1), _state_bytes(player), PROFILER.to_dict() if profile else None
+
+
+def _init_worker():
+    PROFILER.disable()  # a forked worker process starts with a copy of the parent's PROFILER
+
+
+class Job:
+    """ Handle of a submitted run, await it for the player (also after cancel()) """
+
+    def __init__(self, job_id, player, strategy, days, brewery_price, progress_days, max_breweries=None):
+        self.id = job_id
+        self.player = player
+        self.strategy = strategy
+        self.days = days
+        self.brewery_price = brewery_price
+        self.progress_days = progress_days
+        self.max_breweries = max_breweries
+        self.state = PENDING
+        self.days_done = 0
+        self.error = None  # exception of a failed job
+        self.last_progress = None
+        self._callbacks = []
+        self._queues = []
+        self._cancel_requested = False
+        self._task = None
+        self._loop = None
+
+    @property
+    def done(self):
+        return self.state in FINAL_STATES
+
+    def __await__(self):
+        return self._task.__await__()
+
+    def cancel(self):
+        """ Stops the job without waiting for the chunk in progress, the player keeps the chunks finished before
+            (thread-safe)
+        """
+        if self.done or self._cancel_requested:
+            return
+        self._cancel_requested = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+
+    def add_progress_callback(self, callback):
+        """ Calls callback(progress) for every following Progress event, in the event loop """
+        self._callbacks.append(callback)
+
+    async def progress(self):
+        """ Yields Progress events from now on until the job ends (the final event included) """
+        if self.done:
+            yield self.last_progress
+            return
+        queue = asyncio.Queue()
+        self._queues.append(queue)
+        try:
+            while True:
+                progress = await queue.get()
+                yield progress
+                if progress.state in FINAL_STATES:
+                    return
+        finally:
+            self._queues.remove(queue)
+
+    def _report(self, state):
+        self.state = state
+        self.last_progress = Progress(self.id, state, self.player.day, self.days_done, self.days)
+        for queue in self._queues:
+            queue.put_nowait(self.last_progress)
+        for callback in self._callbacks:
+            callback(self.last_progress)
+
+
+class JobManager:
+    """ Runs jobs in the event loop that submits them, chunks in a pool of worker processes """
+
+    def __init__(self, max_workers=None, executor=None, progress_days=PROGRESS_DAYS):
+        """
+        :param max_workers: number of worker processes (default: number of cores)
+        :param executor: concurrent.futures executor to run chunks in instead (e.g. a ThreadPoolExecutor)
+        :param progress_days: default days run between progress events
+        """
+        self.max_workers = max_workers
+        self.progress_days = progress_days
+        self.jobs = {}  # job id -> Job, while running
+        self._executor = executor
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """ Worker pool, created on first use """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """ Drops a broken worker pool, so the next chunk starts a new one """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, player, strategy, days, brewery_price=Brewery.price_default, progress_days=None,
+               max_breweries=None):
+        """ Starts running player for `days` days with strategy. Call from the event loop (a coroutine or callback).
+
+        :param player: Player (or VectorPlayer), modified by the job
+        :param strategy: Strategy, name from STRATEGIES or schedule text
+        :param progress_days: days run between progress events (default: self.progress_days)
+        :param max_breweries: fail the job after a chunk that leaves the player with more breweries (None = no limit),
+                              e.g. to stop compounding before a worker runs out of memory
+        :return: Job
+        :raises ValueError: for unknown strategies, players with an enabled event log and players with a job running
+        """
+        get_strategy(strategy)  # raises ValueError for unknown strategies
+        if player.event_log.enabled:
+            raise ValueError(f"Player {player.name} has an enabled event log, jobs don't emit events.")
+        if any(job.player is player and not job.done for job in self.jobs.values()):
+            raise ValueError(f"Player {player.name} already has a job running.")
+        job = Job(next(self._ids), player, strategy, days, brewery_price, progress_days or self.progress_days,
+                  max_breweries)
+        job._loop = asyncio.get_running_loop()
+        job._task = job._loop.create_task(self._run(job))
+        self.jobs[job.id] = job
+        return job
+
+    def submit_scenario(self, scenario, progress_days=None):
+        """ Submits a sweep scenario (see sweep.scenario_grid) from day 0, the job's player is a new VectorPlayer """
+        player = VectorPlayer(scenario["num_breweries"], scenario["price"], scenario["br"], name="job")
+        return self.submit(player, scenario["strategy"], scenario["days"], scenario["compound_price"], progress_days)
+
+    async def _run(self, job):
+        loop = asyncio.get_running_loop()
+        player_class = type(job.player)
+        try:
+            job._report(RUNNING)
+            while job.days_done < job.days:
+                days = min(job.progress_days, job.days - job.days_done)
+                executor = self.executor
+                try:
+                    rows, state, profile = await loop.run_in_executor(
+                        executor, _run_chunk, player_class, _state_bytes(job.player), job.strategy, days,
+                        job.brewery_price, PROFILER.enabled)
+                except BrokenProcessPool:
+                    self._discard_executor(executor)
+                    raise
+                _apply(job.player, rows, state)
+                if profile is not None:
+                    PROFILER.merge(profile)
+                job.days_done += days
+                if job.max_breweries is not None and job.player.num_breweries > job.max_breweries:
+                    raise ValueError(f"Job {job.id} stopped at day {job.player.day}: {job.player.num_breweries} "
+                                     f"breweries, more than the limit of {job.max_breweries}.")
+                if job.days_done < job.days:
+                    job._report(RUNNING)
+            job._report(DONE)
+        except asyncio.CancelledError:
+            if not job._cancel_requested:
+                raise
+            job._report(CANCELLED)
+        except Exception as e:
+            job.error = e
+            job._report(FAILED)
+            raise
+        finally:
+            self.jobs.pop(job.id, None)
+        return job.player
+
+    def cancel_all(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+
+    def shutdown(self, wait=False):
+        """ Cancels all jobs and stops the worker pool """
+        self.cancel_all()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+
+# shared by all sessions of the Bokeh server app
+JOBS = JobManager()
@@ -1,112 +1,172 @@
 from functools import partial
 
-from bokeh.models import Button, ColumnDataSource, Select, Span, Spinner
+from bokeh.models import Button, ColumnDataSource, Select, Span, Spinner, TextInput, Toggle
 from bokeh.layouts import row, column, layout
 from bokeh.models.widgets import Paragraph, Div
 from bokeh.plotting import curdoc
 
-from classes import Player
-from helpers import brewery_plot_constructor, plot_constructor, initialization_models, update_output_values
+from engine import VectorPlayer
+from jobs import FAILED, FINAL_STATES, JOBS
+from sessions import SESSIONS
+from strategies import STRATEGIES, get_strategy
+from helpers import brewery_plot_constructor, plot_constructor, initialization_models, update_output_values, \
+    update_profile_div
+from instrumentation import PROFILER
+from plotdata import downsample_data, stream_data
 
 
-PLAYER = Player()
 PLOT = plot_constructor()
 BREWERY_PLOT = brewery_plot_constructor()
 
+CHUNK_DAYS = 50  # days run between progress updates of a run (see jobs)
+MAX_POINTS = 2000  # rows kept per data source, longer histories are downsampled (LTTB)
+MAX_BREWERIES = 1_000_000  # a run stops once it has more breweries (compounding grows them exponentially)
+MEAD_COLUMNS = ("day", "unclaimed_mead", "mead_in_wallet")
+BREWERY_COLUMNS = ("day", "t1", "t2", "t3")
+
+doc = curdoc()
+# simulation state lives in SESSIONS (shared by all sessions of the server process), not in module globals
+SESSION_ID = doc.session_context.id if doc.session_context is not None else "local"
+SESSIONS.create(SESSION_ID)
+
+
+def context():
+    """ :return: SessionContext of this session, re-initialized if it was evicted """
+    ctx = SESSIONS.get(SESSION_ID)
+    if ctx is None:
+        ctx = initialize()
+    return ctx
+
 
 # TODO: mead in wallet and initial br is not really important for initialization
 def initialize():
-    global PLAYER, PLOT, BREWERY_PLOT
-
     # get values from spinners
     num_breweries = int(sp_num_breweries.value)
     average_brewery_price = int(sp_total_price.value//num_breweries)
     br = int(sp_init_br.value)
     mead_in_wallet = float(sp_init_mead.value)
 
-    # initialize and update globals
-    PLAYER = Player(num_breweries, average_brewery_price, br, mead_in_wallet=mead_in_wallet)
-    PLOT = plot_constructor()
-    BREWERY_PLOT = brewery_plot_constructor()
+    # replace the session context (cancels the job of a run in progress)
+    player = VectorPlayer(num_breweries, average_brewery_price, br, mead_in_wallet=mead_in_wallet)
+    ctx = SESSIONS.create(SESSION_ID, player)
 
     # show horizontal line for ROI (we have the sp_total_price for that)
-    # TODO: make work!
-    roi_line = Span(location=sp_total_price.value,
-                    dimension='width', line_color='#F0E442',
-                    line_dash='dashed', line_width=3)
-    PLOT.add_layout(roi_line)
+    roi_line.location = sp_total_price.value
+    roi_line.visible = True
 
     # (Re)-initialize ds_mead
     new_data = {"day": [0],
                 "unclaimed_mead": [0],
-                "mead_in_wallet": [PLAYER.mead_in_wallet]}
+                "mead_in_wallet": [player.mead_in_wallet]}
     ds_mead.data = new_data
 
     # (Re)-initialize ds_breweries
     new_data = {"day": [0],
-                "t1": [PLAYER.num_breweries],
+                "t1": [player.num_breweries],
                 "t2": [0],
                 "t3": [0]}
     ds_breweries.data = new_data
 
     # update outputs
-    update_output_values(PLAYER,
+    update_output_values(player,
                          name=p_company_name_val,
                          day=p_day_val,
                          breweries=p_breweries_val,
                          br=p_br_val,
                          claim_tax=p_claim_tax_val,
                          unclaimed_mead=p_unclaimed_mead_val,
-                         wallet_mead=p_wallet_mead_val)
+                         wallet_mead=p_wallet_mead_val,
+                         break_even=p_break_even_val,
+                         apr=p_apr_val,
+                         vs_hodl=p_vs_hodl_val)
+    return ctx
+
+
+def update_plots(ctx):
+    """ Streams history rows not yet sent, or replaces the data with a downsampled history once it is too long """
+    history = ctx.player.history
+    if len(history) <= ctx.streamed_rows:
+        return
+    with PROFILER.timed("bokeh_stream"):
+        if len(history) <= MAX_POINTS:
+            ds_mead.stream(stream_data(history, ctx.streamed_rows, MEAD_COLUMNS), rollover=MAX_POINTS)
+            ds_breweries.stream(stream_data(history, ctx.streamed_rows, BREWERY_COLUMNS), rollover=MAX_POINTS)
+        else:
+            ds_mead.data = downsample_data(history, MEAD_COLUMNS, MAX_POINTS)
+            ds_breweries.data = downsample_data(history, BREWERY_COLUMNS, MAX_POINTS)
+    ctx.streamed_rows = len(history)
+
+
+def show_progress(ctx, progress):
+    """ Shows the player of the session after a progress event of its job (jobs.Progress) """
+    with ctx.lock:
+        if ctx is SESSIONS.get(SESSION_ID):  # not re-initialized or evicted
+            update_plots(ctx)
+
+            # update outputs
+            update_output_values(ctx.player,
+                                 name=p_company_name_val,
+                                 day=p_day_val,
+                                 breweries=p_breweries_val,
+                                 br=p_br_val,
+                                 claim_tax=p_claim_tax_val,
+                                 unclaimed_mead=p_unclaimed_mead_val,
+                                 wallet_mead=p_wallet_mead_val,
+                                 break_even=p_break_even_val,
+                                 apr=p_apr_val,
+                                 vs_hodl=p_vs_hodl_val)
+            if PROFILER.enabled:
+                update_profile_div(div_profile, PROFILER)
+        if progress.state == FAILED:
+            div_message.text = f"Run failed: {ctx.job.error}"
+        if progress.state in FINAL_STATES:
+            ctx.job = None
+            btn_run_sim.disabled = False
+            btn_cancel_sim.disabled = True
 
 
 def callback_run():
-
-    starting_day = max(1, PLAYER.day)
-    days_to_run = int(sp_run_days.value)  # num days to run
+    ctx = context()
+    if ctx.job is not None and not ctx.job.done:
+        return  # e.g. a double-click, the button is disabled while a run is in progress
+    div_message.text = ""
     brewery_price = int(sp_compound_brewery_price.value)  # MEAD/brewery
 
-    # get strategy
-    strategy = str(sel_strats.value)
-
-    # run simulation for "days_to_run" with selected "strategy"
-    if strategy == "hodl":
-        PLAYER.run_breweries_for_n_days(days_to_run)
-    elif strategy == "compound when possible":
-        for d in range(days_to_run):
-            PLAYER.run_day()
-            if PLAYER.unclaimed_mead >= brewery_price:  # COMPOUND ASAP
-                PLAYER.compound(brewery_price)
-    elif strategy == "claim daily":
-        for d in range(days_to_run):
-            PLAYER.run_day()
-            PLAYER.claim_all_and_tax_to_wallet()
+    # get strategy (custom schedule has priority over selected strategy)
+    try:
+        strategy = get_strategy(str(ti_schedule.value).strip() or str(sel_strats.value))
+    except ValueError as e:
+        div_message.text = str(e)
+        return
+
+    # run simulation for (x) days with selected "strategy" as a job in the worker pool, shown every CHUNK_DAYS days
+    with ctx.lock:
+        ctx.job = JOBS.submit(ctx.player, strategy, int(sp_run_days.value), brewery_price, progress_days=CHUNK_DAYS,
+                              max_breweries=MAX_BREWERIES)
+    # progress events come from the event loop, document changes have to go through a next tick callback
+    ctx.job.add_progress_callback(lambda progress: doc.add_next_tick_callback(partial(show_progress, ctx, progress)))
+    btn_run_sim.disabled = True
+    btn_cancel_sim.disabled = False
+
+
+def callback_cancel():
+    ctx = SESSIONS.get(SESSION_ID)
+    if ctx is not None and ctx.job is not None:
+        ctx.job.cancel()
+
+
+def callback_profile(active):
+    # PROFILER is shared by all sessions of the server process, so it shows their runs together
+    if active:
+        PROFILER.enable()
     else:
-        raise ValueError("You selected something that shouldn't exists. Now give back the reaility stone.")
-
-    # Update data sources
-    new_data = dict()
-    new_data["day"] = PLAYER.history["day"][starting_day:]
-    new_data["unclaimed_mead"] = PLAYER.history["unclaimed_mead"][starting_day:]
-    new_data["mead_in_wallet"] = PLAYER.history["mead_in_wallet"][starting_day:]
-    ds_mead.stream(new_data)  # stream new data to ds_mead
-
-    new_data = {"day": PLAYER.history["day"][starting_day:],
-                "t1": PLAYER.history["breweries_per_tier"]["t1"][starting_day:],
-                "t2": PLAYER.history["breweries_per_tier"]["t2"][starting_day:],
-                "t3": PLAYER.history["breweries_per_tier"]["t3"][starting_day:]}
-    print(new_data)
-    ds_breweries.stream(new_data)  # stream new data to ds_breweries
+        PROFILER.disable()
+    update_profile_div(div_profile, PROFILER)
 
-    # update outputs
-    update_output_values(PLAYER,
-                         name=p_company_name_val,
-                         day=p_day_val,
-                         breweries=p_breweries_val,
-                         br=p_br_val,
-                         claim_tax=p_claim_tax_val,
-                         unclaimed_mead=p_unclaimed_mead_val,
-                         wallet_mead=p_wallet_mead_val)
+
+def callback_profile_reset():
+    PROFILER.reset()
+    update_profile_div(div_profile, PROFILER)
 
 
 # INITIALIZATION
@@ -127,12 +187,15 @@ ds_breweries = ColumnDataSource(data={"day": [0], "t1": [0], "t2": [0], "t3": [0
 ln_mead_unclmd = PLOT.line(x="day", y="unclaimed_mead", line_color="red", line_width=2, legend_label="unclaimed", source=ds_mead)
 ln_mead_wallet = PLOT.line(x="day", y="mead_in_wallet", line_color="blue", line_width=2, legend_label="wallet", source=ds_mead)
 PLOT.legend.location = "top_left"
+# horizontal line for ROI, shown after initialization
+roi_line = Span(location=0, dimension='width', line_color='#F0E442', line_dash='dashed', line_width=3, visible=False)
+PLOT.add_layout(roi_line)
 
 # xs = [ds_mead.data["day"] for _ in range(3)]
 # ys = list(zip(*PLAYER.history["breweries_per_tier"]))
 lns = []
 colors = ["blue", "magenta", "red"]
-for i in range(len(PLAYER.brews_per_tier)):
+for i in range(len(context().player.brews_per_tier)):
     lns.append(BREWERY_PLOT.line(x="day", y=f"t{i+1}", line_color=colors[i], line_width=2,
                                  legend_label=f"T{i+1}", line_dash=f"{i+2} 4", source=ds_breweries))
 BREWERY_PLOT.legend.location = "top_left"
@@ -142,17 +205,29 @@ BREWERY_PLOT.legend.location = "top_left"
 
 # SIMULATION
 # SPINNERS for (x) days, brewery buy price and choice box for strategies
-sp_run_days = Spinner(title="Days to run:", low=1, high=1000, value=1)
+sp_run_days = Spinner(title="Days to run:", low=1, high=10000, value=1)
 sp_compound_brewery_price = Spinner(title="Brewery price (MEAD):", low=1, high=1000, value=100)
 # STRATEGIES (HODL, COMPOUND whenever possible, Claim daily, TODO: Wait for T2 and then COMPOUND)
-sel_strats = Select(title="Strategy:", value="hodl", options=["hodl", "compound when possible", "claim daily"])
+sel_strats = Select(title="Strategy:", value="hodl", options=list(STRATEGIES))
+# custom phase schedule, e.g. "hodl:29,compound:30,claim:60" (last phase continues)
+ti_schedule = TextInput(title="Schedule (optional):", value="", placeholder="hodl:29,compound:30,claim:60")
 
 # BUTTON FOR RUNNING SIMULATION FOR (x) DAYS
 btn_run_sim = Button(label="Advance time")
 btn_run_sim.on_click(callback_run)
+btn_cancel_sim = Button(label="Cancel", disabled=True)
+btn_cancel_sim.on_click(callback_cancel)
+div_message = Div(text="")  # why the last run failed or could not start (e.g. a bad schedule)
 
 # TODO: BUTTONS FOR MANUAL CLAIM AND COMPOUND without advancing time
 
+# PROFILING (per-phase timers and counters, see instrumentation)
+tgl_profile = Toggle(label="Profile simulation", active=PROFILER.enabled)
+tgl_profile.on_change("active", lambda attr, old, new: callback_profile(new))
+btn_profile_reset = Button(label="Reset profile")
+btn_profile_reset.on_click(callback_profile_reset)
+div_profile = Div(text="")
+
 
 # OUTPUTS:
 p_company_name_text, p_company_name_val = Paragraph(text="Company name: "), Paragraph(text="")
@@ -162,14 +237,18 @@ p_br_text, p_br_val = Paragraph(text="Brewer rank: "), Paragraph(text="0 (novice
 p_claim_tax_text, p_claim_tax_val = Paragraph(text="Claim tax: "), Paragraph(text="18 %")
 p_unclaimed_mead_text, p_unclaimed_mead_val = Paragraph(text="Unclaimed mead: "), Paragraph(text="0")
 p_wallet_mead_text, p_wallet_mead_val = Paragraph(text="Mead in wallet: "), Paragraph(text="0")
+p_break_even_text, p_break_even_val = Paragraph(text="Break-even day: "), Paragraph(text="-")
+p_apr_text, p_apr_val = Paragraph(text="APR: "), Paragraph(text="-")
+p_vs_hodl_text, p_vs_hodl_val = Paragraph(text="Mead vs. hodl: "), Paragraph(text="+0.00")
 
-outputs_text = column(p_company_name_text, p_day_text, p_breweries_text, p_br_text, p_claim_tax_text, p_unclaimed_mead_text, p_wallet_mead_text)
-outputs_vals = column(p_company_name_val, p_day_val, p_breweries_val, p_br_val, p_claim_tax_val, p_unclaimed_mead_val, p_wallet_mead_val)
+outputs_text = column(p_company_name_text, p_day_text, p_breweries_text, p_br_text, p_claim_tax_text, p_unclaimed_mead_text, p_wallet_mead_text, p_break_even_text, p_apr_text, p_vs_hodl_text)
+outputs_vals = column(p_company_name_val, p_day_val, p_breweries_val, p_br_val, p_claim_tax_val, p_unclaimed_mead_val, p_wallet_mead_val, p_break_even_val, p_apr_val, p_vs_hodl_val)
 
 # MARKUP
 h3_stats = Div(text="""<h3>Stats</h3>""", align="center")
 h3_init = Div(text="""<h3>Initialization</h3>""", align="center")
 h3_run = Div(text="""<h3>Run simulation</h3>""", align="center")
+h3_profile = Div(text="""<h3>Profile</h3>""", align="center")
 
 # init_input_row = row(column(sp_num_breweries, sp_total_price), column(sp_init_br, sp_init_mead))
 # in_out_layout = layout(children=[h3_stats,
@@ -194,11 +273,15 @@ in_out_layout = layout(children=[h3_stats,
                                  sp_run_days,
                                  sp_compound_brewery_price,
                                  sel_strats,
-                                 btn_run_sim],
+                                 ti_schedule,
+                                 row(btn_run_sim, btn_cancel_sim),
+                                 div_message,
+                                 h3_profile,
+                                 row(tgl_profile, btn_profile_reset),
+                                 div_profile],
                        sizing_mode="scale_width", max_width=300)
 
 full_layout = row(in_out_layout, column(PLOT, BREWERY_PLOT), sizing_mode="scale_height")
 
-doc = curdoc()
 # put the button and plot in a layout and add to the document
 doc.add_root(full_layout)
@@ -0,0 +1,156 @@
+""" Monte Carlo runs of a strategy under stochastic MEAD prices, compound prices and reward/tax shocks
+
+Example:
+    python montecarlo.py --trajectories 20000 --days 365 --strategy compound --price-volatility 0.05
+"""
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from engine import CohortBatch
+from strategies import CLAIM, COMPOUND, STRATEGIES, get_strategy
+
+PERCENTILES = (5, 25, 50, 75, 95)
+OUTPUTS = ("mead_in_wallet", "unclaimed_mead", "wallet_value")
+
+
+def _log_random_walk(rng, start, drift, volatility, days, size):
+    """ Geometric Brownian motion with daily steps
+
+    :return: (days + 1, size) array starting at `start`
+    """
+    if volatility:
+        steps = rng.normal(drift - volatility**2/2, volatility, size=(days, size))
+    else:
+        steps = np.full((days, size), drift)
+    return start*np.exp(np.vstack((np.zeros((1, size)), np.cumsum(steps, axis=0))))
+
+
+def simulate_batch(seed, size, days, strategy="compound when possible", num_breweries=1, br=0, mead_in_wallet=0.,
+                   compound_price=100., compound_price_volatility=0., mead_price=1., price_drift=0.,
+                   price_volatility=0., reward_volatility=0., tax_volatility=0.):
+    """ Simulates one batch of trajectories
+
+    :param seed: seed or np.random.SeedSequence of this batch
+    :param size: number of trajectories
+    :param days: horizon in days
+    :param strategy: Strategy, name from STRATEGIES or schedule text
+    :param num_breweries: initial number of breweries
+    :param br: initial BR
+    :param mead_in_wallet: initial MEAD in wallet
+    :param compound_price: initial price of one brewery (MEAD) when compounding
+    :param compound_price_volatility: daily log-volatility of the compound price
+    :param mead_price: initial value of one MEAD (e.g. in USD)
+    :param price_drift: daily log-drift of the MEAD value
+    :param price_volatility: daily log-volatility of the MEAD value
+    :param reward_volatility: log-volatility of a per-trajectory multiplier of mead production
+    :param tax_volatility: standard deviation of a per-trajectory shift of claim taxes
+    :return: dict of OUTPUTS -> (days + 1, size) arrays, wallet_value is mead_in_wallet times MEAD value
+    """
+    rng = np.random.default_rng(seed)
+    strategy = get_strategy(strategy)
+    batch = CohortBatch(size, days, num_breweries, br, mead_in_wallet)
+    if reward_volatility:
+        batch.mead_factor = rng.lognormal(-reward_volatility**2/2, reward_volatility, size)
+    if tax_volatility:
+        batch.claim_tax_shift = rng.normal(0., tax_volatility, size)
+    mead_value = _log_random_walk(rng, mead_price, price_drift, price_volatility, days, size)
+    compound_prices = _log_random_walk(rng, compound_price, 0., compound_price_volatility, days, size)
+
+    results = {name: np.empty((days + 1, size)) for name in OUTPUTS}
+    results["mead_in_wallet"][0] = batch.mead_in_wallet
+    results["unclaimed_mead"][0] = batch.unclaimed_mead
+    for day in range(1, days + 1):
+        action = strategy.action(batch.day)
+        batch.run_day()
+        if action == COMPOUND:
+            batch.compound(compound_prices[day], batch.unclaimed_mead >= compound_prices[day])
+        elif action == CLAIM:
+            batch.claim_all_and_tax_to_wallet()
+        results["mead_in_wallet"][day] = batch.mead_in_wallet
+        results["unclaimed_mead"][day] = batch.unclaimed_mead
+    results["wallet_value"] = results["mead_in_wallet"]*mead_value
+    return results
+
+
+def _simulate_batch(args):
+    seed, size, days, scenario = args
+    return simulate_batch(seed, size, days, **scenario)
+
+
+def run_monte_carlo(trajectories=10000, days=365, percentiles=PERCENTILES, seed=None, batch_size=1000,
+                    max_workers=None, **scenario):
+    """ Runs trajectories in batches over a process pool and summarizes them per day
+
+    Every batch gets its own RNG stream spawned from `seed`, so results only depend on seed and batch_size
+    (not on the number of workers).
+
+    :param trajectories: number of simulated trajectories
+    :param days: horizon in days
+    :param percentiles: percentiles reported for every day
+    :param seed: root seed (None = random)
+    :param batch_size: trajectories simulated together in one worker call
+    :param max_workers: number of worker processes (default: number of cores)
+    :param scenario: keyword arguments of simulate_batch (strategy, num_breweries, price_volatility, ...)
+    :return: dict with "day", "percentiles" and, for each of OUTPUTS, a (len(percentiles), days + 1) array
+    """
+    num_batches = math.ceil(trajectories/batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(num_batches)
+    sizes = [min(batch_size, trajectories - i*batch_size) for i in range(num_batches)]
+    tasks = [(batch_seed, size, days, scenario) for batch_seed, size in zip(seeds, sizes)]
+
+    max_workers = min(max_workers or os.cpu_count() or 1, num_batches)
+    if max_workers == 1:
+        batches = [_simulate_batch(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            batches = list(executor.map(_simulate_batch, tasks))
+
+    summary = {"day": np.arange(days + 1), "percentiles": tuple(percentiles)}
+    for name in OUTPUTS:
+        values = np.hstack([batch[name] for batch in batches])
+        summary[name] = np.percentile(values, percentiles, axis=1)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Percentile bands of wallet and unclaimed MEAD per day.")
+    parser.add_argument("--trajectories", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--strategy", default="compound when possible",
+                        help=f"strategy name {tuple(STRATEGIES)} or schedule, e.g. hodl:29,compound:30,claim:60")
+    parser.add_argument("--breweries", type=int, default=1, help="initial number of breweries")
+    parser.add_argument("--br", type=int, default=0, help="initial BR")
+    parser.add_argument("--compound-price", type=float, default=100.)
+    parser.add_argument("--compound-price-volatility", type=float, default=0.)
+    parser.add_argument("--mead-price", type=float, default=1.)
+    parser.add_argument("--price-drift", type=float, default=0.)
+    parser.add_argument("--price-volatility", type=float, default=0.)
+    parser.add_argument("--reward-volatility", type=float, default=0.)
+    parser.add_argument("--tax-volatility", type=float, default=0.)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+    try:
+        get_strategy(args.strategy)
+    except ValueError as e:
+        parser.error(str(e))
+
+    summary = run_monte_carlo(args.trajectories, args.days, seed=args.seed, max_workers=args.workers,
+                              strategy=args.strategy, num_breweries=args.breweries, br=args.br,
+                              compound_price=args.compound_price,
+                              compound_price_volatility=args.compound_price_volatility,
+                              mead_price=args.mead_price, price_drift=args.price_drift,
+                              price_volatility=args.price_volatility, reward_volatility=args.reward_volatility,
+                              tax_volatility=args.tax_volatility)
+
+    print("day," + ",".join(f"{name}_p{p}" for name in OUTPUTS for p in summary["percentiles"]))
+    for day in summary["day"]:
+        print(f"{day}," + ",".join(f"{value:.2f}" for name in OUTPUTS for value in summary[name][:, day]))
+
+
+if __name__ == "__main__":
+    main()
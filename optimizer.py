@@ -0,0 +1,203 @@
+""" Beam search for a good day-by-day hold/compound/claim policy of a Player over a horizon
+
+This is a heuristic: compounding on different days leads to different brewery cohorts, so the number of states
+grows too fast for an exhaustive search beyond short horizons (e.g. 2 breweries over 90 days already expand ~500,000
+states) and the beam keeps the most promising states only. Policy.exact tells when nothing was dropped.
+
+Example:
+    python optimizer.py --breweries 1 --days 180
+"""
+import argparse
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from functools import lru_cache
+
+from classes import Brewery, Player
+from cohorts import compress, hold_production, run_day
+from strategies import CLAIM, COMPOUND, HODL, Schedule
+
+_BR_PER_BUY = 10  # see Player.buy_breweries
+_BR_REQUIREMENTS = Player._Player__br_requirements
+_CLAIM_TAXES = Player._Player__claim_taxes
+_MAX_BR = _BR_REQUIREMENTS[-1]
+
+Policy = namedtuple("Policy", ["actions", "value", "exact", "states"])
+Policy.__doc__ = """ actions: action taken after each day of the horizon (HODL, COMPOUND or CLAIM)
+    value: MEAD in wallet after the last day (the policy claims everything on the last day)
+    exact: True if the beam never dropped a state (the policy is then optimal), else value is a lower bound of the
+           optimum
+    states: number of states expanded
+"""
+
+
+@lru_cache(maxsize=None)
+def _claim_tax(br):
+    rank = max(rank for rank, requirement in enumerate(_BR_REQUIREMENTS) if br >= requirement)
+    return _CLAIM_TAXES[rank]
+
+
+def _memoized(function):
+    """ :return: function with a transposition table (many states share the same cohorts) that lives as long as the
+                 returned function, e.g. for one search_policy() call
+    """
+    table = {}
+
+    def memoized(*args):
+        try:
+            return table[args]
+        except KeyError:
+            result = table[args] = function(*args)
+            return result
+    return memoized
+
+
+def _claim_all(cohorts, new_breweries=0):
+    """ :return: cohorts after claiming from all breweries and buying new_breweries """
+    new_cohorts = {(0, 0): new_breweries} if new_breweries else {}
+    for (_, days_after_fp), n in cohorts:
+        new_cohorts[(0, days_after_fp)] = new_cohorts.get((0, days_after_fp), 0) + n
+    return tuple(sorted(new_cohorts.items()))
+
+
+def _hold_value(cohorts, unclaimed_mead, br, mead_in_wallet, days, hold_production=hold_production):
+    """ Wallet after holding for the remaining days and claiming everything at the end (achievable lower bound) """
+    mead = unclaimed_mead
+    for (days_after_claim, days_after_fp), n in cohorts:
+        brewery_mead, brewery_br = hold_production(days_after_claim, days_after_fp, days)
+        mead += n*brewery_mead
+        br += n*brewery_br
+    return mead_in_wallet + mead - mead*_claim_tax(min(br, _MAX_BR))
+
+
+def _prune_dominated(layer):
+    """ Drops states dominated by another state with the same cohorts and at least as much unclaimed MEAD, br and
+        MEAD in wallet (Pareto dominance, br only ever lowers claim taxes)
+    """
+    groups = {}
+    for key, value in layer.items():
+        cohorts, unclaimed_mead, br = key
+        groups.setdefault(cohorts, []).append((unclaimed_mead, br, value[0], key))
+    pruned = {}
+    for states in groups.values():
+        # states seen so far have at least as much unclaimed mead, their (br, wallet) Pareto front is kept as
+        # negated br ascending with wallet ascending
+        front_br = []
+        front_wallet = []
+        for _, br, mead_in_wallet, key in sorted(states, reverse=True):
+            k = bisect_right(front_br, -br)  # front points before k have at least as much br
+            if k > 0 and front_wallet[k - 1] >= mead_in_wallet:
+                continue  # dominated (the front point before k has the most wallet of those)
+            pruned[key] = layer[key]
+            i = j = bisect_left(front_br, -br)  # front points from i on have no more br
+            while j < len(front_br) and front_wallet[j] <= mead_in_wallet:
+                j += 1  # less br and no more wallet: dominated by this state
+            front_br[i:j] = [-br]
+            front_wallet[i:j] = [mead_in_wallet]
+    return pruned
+
+
+def search_policy(player, days, brewery_price=Brewery.price_default, beam_width=1000):
+    """ Heuristic policy search: forward dynamic programming over compressed cohort states of player for the next
+        `days` days, keeping at most beam_width states per day
+
+    A state is (cohorts, unclaimed mead, br capped at the last rank requirement); MEAD in wallet is only ever added
+    to, so of states with the same cohorts only those not dominated in unclaimed mead, br and MEAD in wallet are
+    kept (this assumes that more unclaimed mead is never worse). Claiming before the last day is
+    never better than holding (claim tax only decreases with rank and claiming restarts fermentation), so each day
+    the choice is between HODL and COMPOUND, and the policy claims everything on the last day.
+
+    :param player: Player (or VectorPlayer) in its current state, it is not modified
+    :param days: horizon in days
+    :param brewery_price: price of one Brewery in MEAD when compounding
+    :param beam_width: maximum number of states kept per day (best by _hold_value)
+    :return: Policy
+    """
+    brewery_states = player._brewery_states()
+    unclaimed_mead = sum(mead for _, _, mead in brewery_states)
+    stray_mead = player.unclaimed_mead - unclaimed_mead  # unclaimed mead that doesn't belong to any brewery
+    start = (compress(brewery_states), unclaimed_mead, min(player.br, _MAX_BR))
+
+    run_cohorts_day = _memoized(run_day)
+    claim_all = _memoized(_claim_all)
+    hold_cohort = _memoized(hold_production)
+    layer = {start: (player.mead_in_wallet, None, None)}
+    layers = []
+    exact = True
+    states = 0
+    for day in range(1, days + 1):
+        next_layer = {}
+
+        def add(key, mead_in_wallet, parent, action):
+            if key not in next_layer or mead_in_wallet > next_layer[key][0]:
+                next_layer[key] = (mead_in_wallet, parent, action)
+
+        for key, (mead_in_wallet, _, _) in layer.items():
+            states += 1
+            cohorts, unclaimed_mead, br = key
+            cohorts, mead, br_earned = run_cohorts_day(cohorts)
+            unclaimed_mead += mead
+            br = min(br + br_earned, _MAX_BR)
+
+            if day == days:
+                claimed = unclaimed_mead
+                if claimed > 0:
+                    mead_in_wallet += claimed - claimed*_claim_tax(br)
+                add((claim_all(cohorts), 0, br), mead_in_wallet, key, CLAIM)
+                continue
+
+            add((cohorts, unclaimed_mead, br), mead_in_wallet, key, HODL)
+            if unclaimed_mead + stray_mead > brewery_price:
+                bought, rest = divmod(unclaimed_mead, brewery_price)
+                br_after = min(br + _BR_PER_BUY*bought, _MAX_BR)
+                if rest > 0:
+                    mead_in_wallet += rest - rest*_claim_tax(br_after)
+                add((claim_all(cohorts, bought), 0, br_after), mead_in_wallet, key, COMPOUND)
+
+        next_layer = _prune_dominated(next_layer)
+        if len(next_layer) > beam_width:
+            exact = False
+            ranked = sorted(next_layer, key=lambda k: _hold_value(*k, next_layer[k][0], days - day, hold_cohort), reverse=True)
+            next_layer = {k: next_layer[k] for k in ranked[:beam_width]}
+        layers.append(next_layer)
+        layer = next_layer
+
+    # follow the parents back from the best final state
+    key = max(layer, key=lambda k: layer[k][0]) if days > 0 else start
+    value = layer[key][0]
+    actions = []
+    for past_layer in reversed(layers):
+        _, key, action = past_layer[key]
+        actions.append(action)
+    return Policy(actions[::-1], value, exact, states)
+
+
+def policy_schedule(actions, start_day=0):
+    """ :return: Schedule taking `actions` from start_day on (e.g. for strategies.run_strategy) """
+    phases = [(HODL, start_day)] if start_day else []
+    for action in actions:
+        if phases and phases[-1][0] == action:
+            phases[-1] = (action, phases[-1][1] + 1)
+        else:
+            phases.append((action, 1))
+    return Schedule(phases)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hold/compound policy found by beam search and its final wallet value.")
+    parser.add_argument("--breweries", type=int, default=1, help="initial number of breweries")
+    parser.add_argument("--price", type=int, default=100, help="price per initial brewery (MEAD)")
+    parser.add_argument("--br", type=int, default=0, help="initial BR")
+    parser.add_argument("--days", type=int, default=180, help="horizon in days")
+    parser.add_argument("--compound-price", type=int, default=100, help="brewery price when compounding")
+    parser.add_argument("--beam-width", type=int, default=1000, help="maximum number of states kept per day")
+    args = parser.parse_args(argv)
+
+    player = Player(args.breweries, args.price, args.br, name="optimizer")
+    policy = search_policy(player, args.days, args.compound_price, args.beam_width)
+    print(f"Schedule: {policy_schedule(policy.actions)}")
+    print(f"Final wallet: {policy.value:.2f} MEAD ({'optimal' if policy.exact else 'beam search, lower bound'}, "
+          f"{policy.states} states)")
+
+
+if __name__ == "__main__":
+    main()
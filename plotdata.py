@@ -0,0 +1,47 @@
+""" Plot data from Player history, independent of Bokeh (the UI layer is helpers.py and main.py) """
+import numpy as np
+
+
+def stream_data(history, start, columns):
+    """ NumPy views (no copy) of history rows from `start` on, ready for ColumnDataSource.stream """
+    return {name: np.asarray(view) for name, view in history.slice(start, columns=columns).items()}
+
+
+def lttb_indices(x, y, n_out):
+    """ Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013)
+
+    Keeps the first and last point and, from each of n_out - 2 equal buckets in between, the point forming the
+    largest triangle with the point kept before it and the average of the next bucket.
+
+    :return: sorted indices of the n_out points kept (all indices if there are not more than n_out points)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # n_out - 2 buckets, the last point is its own bucket
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        x_avg, y_avg = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        areas = np.abs((x[a] - x_avg)*(y[start:stop] - y[a]) - (x[a] - x[start:stop])*(y_avg - y[a]))
+        a = indices[i + 1] = start + int(np.argmax(areas))
+    return indices
+
+
+def downsample_data(history, columns, max_points):
+    """ At most max_points rows of history chosen by LTTB, ready to replace ColumnDataSource.data
+
+    Every y column picks its share of the points, the union of those rows is kept for all columns.
+
+    :param columns: x column ("day") followed by the y columns
+    """
+    data = stream_data(history, 0, columns)
+    x, ys = columns[0], columns[1:]
+    n_out = max(3, max_points//max(1, len(ys)))
+    rows = np.unique(np.concatenate([lttb_indices(data[x], data[y], n_out) for y in ys]))
+    return {name: values[rows] for name, values in data.items()}
@@ -0,0 +1,121 @@
+""" Per-session simulation state of the Bokeh server app
+
+Bokeh runs main.py once per browser session, but modules it imports are shared by all sessions of the process.
+Every session keeps its simulation in a SessionContext stored in SESSIONS under its session id, so sessions never
+touch each other's state. SESSIONS evicts contexts of sessions idle for too long and, when the total memory of all
+contexts exceeds its limit, the least recently used ones (app_hooks.py wires this to the server). The job running
+on an evicted or removed context is cancelled.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from engine import VectorPlayer
+
+
+class SessionContext:
+    """ Simulation state of one session
+
+    Hold `lock` while changing the player or the run state.
+    """
+
+    def __init__(self, session_id, player=None):
+        self.session_id = session_id
+        self.player = player if player is not None else VectorPlayer()
+        self.job = None  # jobs.Job of the run in progress
+        self.streamed_rows = len(self.player.history)  # history rows already sent to the data sources
+        self.lock = threading.RLock()
+        self.last_access = time.monotonic()
+
+    @property
+    def nbytes(self):
+        """ Bytes allocated for the player's arrays """
+        return self.player.nbytes
+
+    def close(self):
+        """ Cancels the job in progress """
+        if self.job is not None:
+            self.job.cancel()
+
+
+class SessionStore:
+    """ Thread-safe map of session id -> SessionContext, bounded in memory, evicting idle sessions """
+
+    def __init__(self, max_idle=1800., max_memory=512*2**20, max_sessions=1000):
+        """
+        :param max_idle: seconds without access after which a context is evicted
+        :param max_memory: bytes all contexts may use together before the least recently used are evicted
+        :param max_sessions: maximum number of contexts
+        """
+        self.max_idle = max_idle
+        self.max_memory = max_memory
+        self.max_sessions = max_sessions
+        self._contexts = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def __contains__(self, session_id):
+        return session_id in self._contexts
+
+    def get(self, session_id):
+        """ :return: SessionContext of session_id, None if there is none (new or evicted session) """
+        with self._lock:
+            context = self._contexts.get(session_id)
+            if context is not None:
+                context.last_access = time.monotonic()
+                self._contexts.move_to_end(session_id)
+            return context
+
+    def create(self, session_id, player=None):
+        """ Creates (or replaces) the context of session_id, evicting others if the store is over its limits
+
+        :return: the new SessionContext
+        """
+        context = SessionContext(session_id, player)
+        with self._lock:
+            old = self._contexts.get(session_id)
+            if old is not None:
+                old.close()
+            self._contexts[session_id] = context
+            self._contexts.move_to_end(session_id)
+            self._evict_over_limits()
+        return context
+
+    def remove(self, session_id):
+        with self._lock:
+            context = self._contexts.pop(session_id, None)
+        if context is not None:
+            context.close()
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(context.nbytes for context in self._contexts.values())
+
+    def evict_idle(self):
+        """ Evicts contexts idle for longer than max_idle and any beyond the limits
+
+        :return: number of contexts evicted
+        """
+        with self._lock:
+            n = len(self._contexts)
+            now = time.monotonic()
+            for session_id, context in list(self._contexts.items()):
+                if now - context.last_access > self.max_idle:
+                    del self._contexts[session_id]
+                    context.close()
+            self._evict_over_limits()
+            return n - len(self._contexts)
+
+    def _evict_over_limits(self):
+        """ Evicts least recently used contexts (keeping the most recent one) while over max_sessions/max_memory """
+        nbytes = sum(context.nbytes for context in self._contexts.values())
+        while len(self._contexts) > 1 and (len(self._contexts) > self.max_sessions or nbytes > self.max_memory):
+            _, context = self._contexts.popitem(last=False)
+            context.close()
+            nbytes -= context.nbytes
+
+
+SESSIONS = SessionStore()
@@ -0,0 +1,152 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+
+from classes import Brewery
+
+HODL, COMPOUND, CLAIM = range(3)  # actions taken after a day has been run
+ACTION_NAMES = ("hodl", "compound", "claim")
+
+# named strategies and their schedules
+STRATEGIES = {"hodl": "hodl",
+              "compound when possible": "compound",
+              "claim daily": "claim"}
+
+
+def _hodl(player, brewery_price):
+    pass
+
+
+def _compound(player, brewery_price):
+    if player.unclaimed_mead >= brewery_price:  # COMPOUND ASAP
+        player.compound(brewery_price)
+
+
+def _claim(player, brewery_price):
+    player.claim_all_and_tax_to_wallet()
+
+
+_ACTIONS = (_hodl, _compound, _claim)  # indexed by action
+
+
+class Strategy(ABC):
+    """ Decides which action (HODL, COMPOUND or CLAIM) Player takes after each day """
+
+    @abstractmethod
+    def action(self, day):
+        """ :return: action to take after running the day following `day` (i.e. when player.day == day) """
+
+    def key(self):
+        """ :return: text that identifies the actions of this strategy on every day, the same in every process
+                     (e.g. for cache.TrajectoryCache), None if there is none
+        """
+        return None
+
+    def run(self, player, days, brewery_price=Brewery.price_default):
+        """ Runs player for a number of days following this strategy
+
+        :param player: Player (or VectorPlayer) to run
+        :param days: number of days to run
+        :param brewery_price: price of one Brewery in MEAD when compounding
+        :return: None
+        """
+        for _ in range(days):
+            act = _ACTIONS[self.action(player.day)]
+            player.run_day()
+            act(player, brewery_price)
+
+
+class Schedule(Strategy):
+    """ Sequence of phases (action, number of days), compiled into a per-day action table.
+        The last phase continues after the schedule ends.
+
+    Use Schedule.parse("hodl:29,compound:30,claim:60") to build one from text.
+    """
+
+    def __init__(self, phases):
+        """
+        :param phases: list of (action, days) tuples, days of the last phase may be None (= forever)
+        """
+        if not phases:
+            raise ValueError("Schedule needs at least one phase.")
+        for i, (action, days) in enumerate(phases):
+            if action not in range(len(ACTION_NAMES)):
+                raise ValueError(f"Unknown action: {action}.")
+            if days is None and i < len(phases) - 1:
+                raise ValueError("Only the last phase of a schedule can run forever.")
+            if days is not None and days < 1:
+                raise ValueError(f"Phase {ACTION_NAMES[action]} must last at least one day.")
+        self.phases = tuple(phases)
+        self._phase_ends = list(accumulate(days for _, days in self.phases[:-1]))
+        self._table = bytes(action for action, days in self.phases[:-1] for _ in range(days))
+        self._last_action = self.phases[-1][0]
+
+    def __str__(self):
+        return ",".join(ACTION_NAMES[action] if days is None else f"{ACTION_NAMES[action]}:{days}"
+                        for action, days in self.phases)
+
+    @classmethod
+    def parse(cls, spec: str):
+        """ Compiles a schedule like "hodl:29,compound:30,claim:60" (a phase without days runs forever) """
+        return _parse_schedule(spec.replace(" ", "").lower())
+
+    def action(self, day):
+        return self._table[day] if day < len(self._table) else self._last_action
+
+    def key(self):
+        return str(self)
+
+    def _days_left_in_phase(self, day):
+        """ :return: number of days from `day` until the phase changes, None in the last phase """
+        phase = bisect_right(self._phase_ends, day)
+        return self._phase_ends[phase] - day if phase < len(self._phase_ends) else None
+
+    def run(self, player, days, brewery_price=Brewery.price_default):
+        last_day = player.day + days
+        while player.day < last_day:
+            action = self.action(player.day)
+            days_left = self._days_left_in_phase(player.day)
+            span = last_day - player.day if days_left is None else min(days_left, last_day - player.day)
+            if action == HODL:
+                player.run_breweries_for_n_days(span, fast_forward=True)
+            else:
+                act = _ACTIONS[action]
+                for _ in range(span):
+                    player.run_day()
+                    act(player, brewery_price)
+
+
+@lru_cache(maxsize=128)
+def _parse_schedule(spec):
+    phases = []
+    for phase in spec.split(","):
+        name, _, days = phase.partition(":")
+        if name not in ACTION_NAMES:
+            raise ValueError(f"Unknown action '{name}' in schedule '{spec}'. Choose from {ACTION_NAMES}.")
+        try:
+            phases.append((ACTION_NAMES.index(name), int(days) if days else None))
+        except ValueError:
+            raise ValueError(f"Number of days of phase '{phase}' in schedule '{spec}' is not an integer.") from None
+    return Schedule(phases)
+
+
+def get_strategy(strategy):
+    """ :param strategy: Strategy, name from STRATEGIES or schedule text (see Schedule.parse)
+        :return: Strategy
+    """
+    if isinstance(strategy, Strategy):
+        return strategy
+    return Schedule.parse(STRATEGIES.get(strategy, strategy))
+
+
+def run_strategy(player, strategy, days, brewery_price=Brewery.price_default):
+    """ Runs player for a number of days with selected strategy
+
+    :param player: Player (or VectorPlayer) to run
+    :param strategy: Strategy, name from STRATEGIES or schedule text (e.g. "hodl:29,compound:30,claim:60")
+    :param days: number of days to run
+    :param brewery_price: price of one Brewery in MEAD when compounding
+    :return: None
+    """
+    get_strategy(strategy).run(player, days, brewery_price)
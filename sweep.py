@@ -0,0 +1,123 @@
+""" Headless strategy sweeps
+
+Example:
+    python sweep.py --breweries 1 5 10 --price 100 --br 0 --strategy hodl "claim daily" --days 365 -o results.csv
+
+Add --profile profile.json to write per-phase timers and counters of all runs (see instrumentation).
+"""
+import argparse
+import csv
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import VectorPlayer
+from instrumentation import PROFILER
+from strategies import STRATEGIES, get_strategy, run_strategy
+
+PARAMETERS = ("num_breweries", "price", "br", "strategy", "days", "compound_price")
+RESULTS = ("num_breweries_end", "t1", "t2", "t3", "br_end", "rank_name", "invested_mead", "unclaimed_mead",
+           "mead_in_wallet", "break_even_day", "roi", "apr", "vs_hodl", "max_drawdown_vs_hodl", "days_to_t2", "days_to_t3")
+
+
+def scenario_grid(num_breweries, price, br, strategy, days, compound_price):
+    """ Builds all combinations of the given parameter values
+
+    :return: list of scenarios (dicts with PARAMETERS as keys)
+    """
+    return [dict(zip(PARAMETERS, values))
+            for values in itertools.product(num_breweries, price, br, strategy, days, compound_price)]
+
+
+def run_scenario(scenario):
+    """ Simulates one scenario from day 0
+
+    :param scenario: dict with PARAMETERS as keys
+    :return: row with the scenario parameters followed by RESULTS
+    """
+    player = VectorPlayer(scenario["num_breweries"], scenario["price"], scenario["br"], name="sweep")
+    run_strategy(player, scenario["strategy"], scenario["days"], scenario["compound_price"])
+
+    results = (player.num_breweries, *player.brews_per_tier, player.br, player.rank_name, player.invested_mead,
+               player.unclaimed_mead, player.mead_in_wallet)
+    return {**scenario, **dict(zip(RESULTS, results)), **player.analytics.summary()}
+
+
+def _run_scenario_profiled(scenario):
+    """ run_scenario in a worker process with the profiler on
+
+    :return: result row, PROFILER.to_dict() of the run
+    """
+    PROFILER.reset()
+    PROFILER.enable()
+    row = run_scenario(scenario)
+    return row, PROFILER.to_dict()
+
+
+def run_sweep(scenarios, max_workers=None, chunksize=None):
+    """ Runs scenarios in parallel over a process pool
+
+    :param scenarios: iterable of scenarios (see scenario_grid)
+    :param max_workers: number of worker processes (default: number of cores)
+    :param chunksize: scenarios sent to a worker at once (default: spread evenly, ~4 chunks per worker)
+    :return: list of result rows in the same order as scenarios (timers and counters of worker processes are
+             added to PROFILER if it is enabled)
+    """
+    scenarios = list(scenarios)
+    max_workers = max_workers or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(scenarios) // (4*max_workers))
+    if max_workers == 1:
+        return [run_scenario(scenario) for scenario in scenarios]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        if not PROFILER.enabled:
+            return list(executor.map(run_scenario, scenarios, chunksize=chunksize))
+        rows = []
+        for row, profile in executor.map(_run_scenario_profiled, scenarios, chunksize=chunksize):
+            rows.append(row)
+            PROFILER.merge(profile)
+        return rows
+
+
+def write_csv(rows, file):
+    writer = csv.DictWriter(file, fieldnames=PARAMETERS + RESULTS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a grid of scenarios and write one results row per scenario.")
+    parser.add_argument("--breweries", type=int, nargs="+", default=[1], help="initial number of breweries")
+    parser.add_argument("--price", type=int, nargs="+", default=[100], help="price per initial brewery (MEAD)")
+    parser.add_argument("--br", type=int, nargs="+", default=[0], help="initial BR")
+    parser.add_argument("--strategy", nargs="+", default=list(STRATEGIES),
+                        help=f"strategy name {tuple(STRATEGIES)} or schedule, e.g. hodl:29,compound:30,claim:60")
+    parser.add_argument("--days", type=int, nargs="+", default=[365], help="horizon in days")
+    parser.add_argument("--compound-price", type=int, nargs="+", default=[100], help="brewery price when compounding")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-o", "--output", default=None, help="output csv file (default: stdout)")
+    parser.add_argument("--profile", default=None, help="write per-phase timers and counters to this JSON file")
+    args = parser.parse_args(argv)
+    for strategy in args.strategy:
+        try:
+            get_strategy(strategy)
+        except ValueError as e:
+            parser.error(str(e))
+
+    scenarios = scenario_grid(args.breweries, args.price, args.br, args.strategy, args.days, args.compound_price)
+    if args.profile is not None:
+        PROFILER.enable()
+    rows = run_sweep(scenarios, max_workers=args.workers)
+    if args.profile is not None:
+        PROFILER.dump(args.profile)
+
+    if args.output is None:
+        write_csv(rows, sys.stdout)
+    else:
+        with open(args.output, "w", newline="") as f:
+            write_csv(rows, f)
+
+
+if __name__ == "__main__":
+    main()